@@ -0,0 +1,446 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+from typing import List, Optional
+from fastapi import APIRouter, File, Header, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from dotenv import load_dotenv
+from openai_client import get_async_openai_client
+from async_database import AsyncDatabaseManager
+from run_waiter import wait_for_run_async, get_run_reply_async
+from run_scheduler import run_scheduler
+from chat_engine import use_chat_backend, complete_chat_async
+from rate_limiter import get_rate_governor, estimate_tokens, reported_tokens, RATE_LIMIT_COMPLETION_ESTIMATE
+from document_extraction import SUPPORTED_EXTENSIONS, file_extension
+from jobs import JobQueue, TERMINAL_JOB_STATUSES
+import app as flask_backend
+from app import (
+    assistant_id, upload_executor, UPLOAD_READ_CHUNK_BYTES, JOB_EVENTS_POLL_INTERVAL, JOB_EVENTS_TIMEOUT,
+    generate_secure_token, ingest_upload, rebuild_project_corpus, enqueue_project_cleanup,
+    load_document_content, build_slide_message, get_edit_prompt, sort_slides, export_deck_pdf,
+    slide_cache_key, project_corpus_hash, get_cached_slide, cache_slide_result, record_thread_usage,
+    translate_project_deck
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('AsyncAPI')
+
+load_dotenv()
+
+# Async ports of the Flask routes in app.py, with the same paths, payloads and
+# responses. Waiting on OpenAI and MongoDB happens on the event loop; S3,
+# extraction and rendering reuse app.py's helpers on worker threads.
+router = APIRouter()
+
+_db: Optional[AsyncDatabaseManager] = None
+
+
+def get_db() -> AsyncDatabaseManager:
+    # Created on first use so the Motor client binds to the serving event loop
+    global _db
+    if _db is None:
+        _db = AsyncDatabaseManager()
+    return _db
+
+
+def error_response(message: str, status_code: int, **extra) -> JSONResponse:
+    return JSONResponse({'error': message, **extra}, status_code=status_code)
+
+
+async def json_body(request: Request) -> dict:
+    try:
+        return await request.json() or {}
+    except ValueError:
+        return {}
+
+
+async def authorize(authorization: Optional[str]):
+    """Resolve the project for a bearer token; returns (project, error_response)"""
+    if not authorization:
+        return None, error_response('No token provided', 401)
+    token = authorization.replace('Bearer ', '')
+    project = await get_db().get_project_by_token(token)
+    if not project:
+        return None, error_response('Invalid token', 401)
+    return project, None
+
+
+async def run_assistant(thread_id: str, message_content: str, project_id: Optional[str] = None) -> Optional[str]:
+    """Post a message to the thread, run the assistant and return its reply.
+
+    Queued in run_scheduler behind other runs on the thread, including those
+    started by the Flask routes in this process.
+    """
+    return await run_scheduler.run_async(thread_id, _run_assistant, thread_id, message_content, project_id,
+                                         project_id=project_id)
+
+
+async def _run_assistant(thread_id: str, message_content: str, project_id: Optional[str]) -> Optional[str]:
+    client = get_async_openai_client()
+    estimate = estimate_tokens(message_content, completion=RATE_LIMIT_COMPLETION_ESTIMATE)
+    async with get_rate_governor('assistant').admit(estimate) as grant:
+        await client.beta.threads.messages.create(
+            thread_id=thread_id,
+            role="user",
+            content=message_content
+        )
+        run = await client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id
+        )
+        run = await wait_for_run_async(client, thread_id, run)
+        grant.usage = reported_tokens(run)
+    if run.status != "completed":
+        logger.error("Failed to generate slide content")
+        return None
+
+    await asyncio.to_thread(record_thread_usage, project_id, thread_id, run)
+    return await get_run_reply_async(client, thread_id, run.id)
+
+
+async def generate_reply(thread_id: str, message_content: str, project_id: Optional[str] = None) -> Optional[str]:
+    """Answer a slide or edit prompt with the configured GENERATION_BACKEND"""
+    if use_chat_backend():
+        return await complete_chat_async(message_content)
+    return await run_assistant(thread_id, message_content, project_id=project_id)
+
+
+async def process_slide_async(thread_id, slide, language, doc_content, corpus_hash=None,
+                              token_count=None, project_id=None) -> Optional[str]:
+    try:
+        logger.info(f"Processing slide: {slide}")
+        # Context selection may embed the corpus, which is a blocking call
+        message_content = await asyncio.to_thread(build_slide_message, slide, language, doc_content,
+                                                  corpus_hash, token_count)
+        if not message_content:
+            return None
+        return await generate_reply(thread_id, message_content, project_id=project_id)
+    except Exception as e:
+        logger.error(f"Error processing slide: {str(e)}")
+        return None
+
+
+@router.post('/create_project')
+async def create_project(request: Request):
+    data = await json_body(request)
+    project_id = data.get('project_id')
+    if not project_id:
+        return error_response('Project ID is required', 400)
+
+    db = get_db()
+    existing_project = await db.get_project(project_id)
+    if existing_project:
+        if 'token' not in existing_project:
+            token = generate_secure_token()
+            await db.update_project_token(project_id, token)
+            existing_project['token'] = token
+
+        return {
+            'token': existing_project['token'],
+            'state': existing_project.get('state', {'current_language': 'en', 'slides': {}}),
+            'message': 'Using existing project',
+            'documents': True if existing_project.get('documents', False) else False,
+            'project_id': project_id
+        }
+
+    # A deleted project keeps its ID until its storage and vectors are removed
+    if await asyncio.to_thread(flask_backend.job_queue.has_unfinished, 'cleanup_project', project_id):
+        return error_response('Project is still being deleted, try again shortly', 409)
+
+    token = generate_secure_token()
+    try:
+        thread = await get_async_openai_client().beta.threads.create()
+        project = await db.create_project(project_id, thread.id, token)
+        return {
+            'token': token,
+            'state': project['state'],
+            'message': 'New project created'
+        }
+    except Exception as e:
+        logger.error(f"Error creating project: {str(e)}")
+        return error_response('Failed to create project', 500)
+
+
+@router.post('/upload_documents')
+async def upload_documents(documents: List[UploadFile] = File(None),
+                           authorization: Optional[str] = Header(None)):
+    project, error = await authorize(authorization)
+    if error:
+        return error
+    project_id = project['project_id']
+
+    if not documents:
+        return error_response('No documents provided', 400)
+
+    results = [{'filename': file.filename, 'status': 'pending'} for file in documents]
+    loop = asyncio.get_running_loop()
+    uploads = {}
+    for index, file in enumerate(documents):
+        if file_extension(file.filename) not in SUPPORTED_EXTENSIONS:
+            results[index].update(status='skipped', error='Unsupported file type')
+            continue
+        # Spool and hash as in the Flask route, then ingest on the shared upload threads
+        fd, path = tempfile.mkstemp(suffix=f'.{file_extension(file.filename)}')
+        digest = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = await file.read(UPLOAD_READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+        uploads[index] = loop.run_in_executor(
+            upload_executor, ingest_upload, project_id, file.filename, path, digest.hexdigest()
+        )
+
+    outcomes = await asyncio.gather(*uploads.values(), return_exceptions=True)
+    processed_documents = []
+    for index, outcome in zip(uploads, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"Error processing file {results[index]['filename']}: {str(outcome)}")
+            results[index].update(status='failed', error=str(outcome))
+        else:
+            processed_documents.append(outcome)
+            results[index]['status'] = 'processed'
+
+    if not processed_documents:
+        return error_response('No valid documents were processed', 400, documents=results)
+
+    await get_db().update_project_documents(project_id, processed_documents)
+    try:
+        await asyncio.to_thread(rebuild_project_corpus, project_id, project.get('corpus'))
+    except Exception as e:
+        logger.error(f"Error building corpus for project {project_id}: {str(e)}")
+    return {
+        'status': 'success',
+        'message': f'{len(processed_documents)} documents processed',
+        'documents': results
+    }
+
+
+@router.post('/set_language')
+async def set_language(request: Request, authorization: Optional[str] = Header(None)):
+    project, error = await authorize(authorization)
+    if error:
+        return error
+    data = await json_body(request)
+    language = data.get('language')
+    if language not in ['en', 'no']:
+        return error_response('Invalid language', 400)
+
+    if data.get('translate'):
+        try:
+            result = await asyncio.to_thread(translate_project_deck, project['project_id'], language)
+            if not result:
+                return error_response('Project not found', 404)
+            get_db().invalidate_project_cache(project['project_id'])
+            state, report = result
+            return {
+                'status': 'success',
+                'message': f'Language set to {language}',
+                'state': state,
+                'translation': report
+            }
+        except Exception as e:
+            logger.error(f"Error translating deck: {str(e)}")
+            return error_response(f'Error translating deck: {str(e)}', 500)
+
+    try:
+        if not await get_db().update_project_language(project['project_id'], language):
+            return error_response('Failed to update language', 500)
+        project['state']['current_language'] = language
+        return {
+            'status': 'success',
+            'message': f'Language set to {language}',
+            'state': project['state']
+        }
+    except Exception as e:
+        logger.error(f"Error setting language: {str(e)}")
+        return error_response(f'Error setting language: {str(e)}', 500)
+
+
+@router.post('/generate_slides')
+async def generate_slides(request: Request, authorization: Optional[str] = Header(None)):
+    project, error = await authorize(authorization)
+    if error:
+        return error
+    data = await json_body(request)
+    slide = data.get('slide')
+
+    if not project.get('documents'):
+        # The upload may have been handled by another worker after this token was cached
+        project = await get_db().get_project_by_token(project['token'], use_cache=False) or project
+    if not project.get('documents'):
+        return error_response('No documents provided', 400)
+    if not slide:
+        return error_response('No slide specified', 400)
+
+    force_regenerate = bool(data.get('force_regenerate'))
+    if data.get('async'):
+        job_id = await asyncio.to_thread(flask_backend.job_queue.enqueue, 'generate_slide',
+                                         {'slide': slide, 'force_regenerate': force_regenerate},
+                                         project_id=project['project_id'])
+        return JSONResponse({'status': 'queued', 'job_id': job_id}, status_code=202)
+
+    language = project['state'].get('current_language', 'en')
+    cache_key = slide_cache_key(slide, language, project_corpus_hash(project))
+    if cache_key and not force_regenerate:
+        slide_content = await asyncio.to_thread(get_cached_slide, cache_key)
+        if slide_content:
+            await get_db().update_slide_content(project['project_id'], slide, slide_content)
+            return {'status': 'completed', 'content': slide_content, 'cached': True}
+
+    try:
+        doc_content = await asyncio.to_thread(load_document_content, project)
+    except Exception as e:
+        logger.error(f"Error loading documents: {str(e)}")
+        return error_response(f'Error loading documents: {str(e)}', 500)
+
+    slide_content = await process_slide_async(project.get('thread_id'), slide, language, doc_content,
+                                              corpus_hash=project.get('corpus', {}).get('content_hash'),
+                                              token_count=project.get('corpus', {}).get('token_count'),
+                                              project_id=project['project_id'])
+    if not slide_content:
+        return error_response('Failed to generate slide content', 500)
+
+    await asyncio.to_thread(cache_slide_result, cache_key, slide, language, slide_content)
+    await get_db().update_slide_content(project['project_id'], slide, slide_content)
+    return {'status': 'completed', 'content': slide_content, 'cached': False}
+
+
+@router.post('/edit_slide')
+async def edit_slide(request: Request, authorization: Optional[str] = Header(None)):
+    project, error = await authorize(authorization)
+    if error:
+        return error
+    data = await json_body(request)
+    slide = (data.get('slide') or '').lower().replace(' ', '_')
+    edit_request = data.get('edit_request')
+
+    db = get_db()
+    current_content = await db.get_slide_content(project['project_id'], slide)
+    if not current_content:
+        return error_response('Slide not found', 404)
+
+    if data.get('async'):
+        job_id = await asyncio.to_thread(flask_backend.job_queue.enqueue, 'edit_slide',
+                                         {'slide': slide, 'edit_request': edit_request},
+                                         project_id=project['project_id'])
+        return JSONResponse({'status': 'queued', 'job_id': job_id}, status_code=202)
+
+    message_content = get_edit_prompt(project['state']['current_language'], edit_request, current_content)
+    try:
+        response = await generate_reply(project['thread_id'], message_content, project_id=project['project_id'])
+        if not response:
+            return error_response('Failed to generate slide content', 500)
+
+        await db.update_slide_content(project['project_id'], slide, response)
+        return {'status': 'completed', 'content': {'content': response, 'status': 'completed'}}
+    except Exception as e:
+        logger.error(f"Error editing slide: {str(e)}")
+        return error_response(f'Error editing slide: {str(e)}', 500)
+
+
+@router.post('/download_pdf')
+async def download_pdf(authorization: Optional[str] = Header(None)):
+    project, error = await authorize(authorization)
+    if error:
+        return error
+    project_id = project['project_id']
+    language = project['state']['current_language']
+    original_slides = project['state']['slides']
+    slides = sort_slides(original_slides, language)
+    if not slides:
+        return error_response('No slides available for this project', 404)
+
+    # Rendering is CPU-bound and only happens on a cache miss
+    export_hash, pdf_bytes = await asyncio.to_thread(export_deck_pdf, project_id, language, slides, original_slides)
+    return Response(
+        pdf_bytes,
+        media_type='application/pdf',
+        headers={
+            'Content-Disposition': f'attachment; filename="{project_id}_slides.pdf"',
+            'ETag': f'"{export_hash}"'
+        }
+    )
+
+
+@router.post('/delete_project')
+async def delete_project(authorization: Optional[str] = Header(None)):
+    project, error = await authorize(authorization)
+    if error:
+        return error
+    db = get_db()
+    # Read the documents fresh so every shared blob reference gets released
+    project = await db.get_project_by_token(project['token'], use_cache=False) or project
+    project_id = project['project_id']
+
+    try:
+        # The soft delete is a single conditional update, so no re-check is needed
+        if not await db.delete_project(project_id):
+            return error_response('Failed to delete project from database', 500)
+    except Exception as e:
+        logger.error(f"Error deleting project: {str(e)}")
+        return error_response(f'Error deleting project: {str(e)}', 500)
+
+    logger.info(f"Successfully deleted project: {project_id}")
+    return {
+        'status': 'success',
+        'message': 'Project deleted',
+        'project_id': project_id,
+        'cleanup_job_id': await asyncio.to_thread(enqueue_project_cleanup, project)
+    }
+
+
+async def get_project_job(job_id: str, project: dict) -> Optional[dict]:
+    job = await asyncio.to_thread(flask_backend.job_queue.get, job_id)
+    if not job or job.get('project_id') != project['project_id']:
+        return None
+    return job
+
+
+@router.get('/jobs/{job_id}')
+async def get_job(job_id: str, authorization: Optional[str] = Header(None)):
+    project, error = await authorize(authorization)
+    if error:
+        return error
+    job = await get_project_job(job_id, project)
+    if not job:
+        return error_response('Job not found', 404)
+    return JobQueue.describe(job)
+
+
+@router.get('/jobs/{job_id}/events')
+async def job_events(job_id: str, authorization: Optional[str] = Header(None)):
+    project, error = await authorize(authorization)
+    if error:
+        return error
+    if not await get_project_job(job_id, project):
+        return error_response('Job not found', 404)
+
+    async def stream():
+        # Server-sent events: one event per observed change, until the job finishes
+        last = None
+        deadline = time.monotonic() + JOB_EVENTS_TIMEOUT
+        while True:
+            current = await asyncio.to_thread(flask_backend.job_queue.get, job_id)
+            if current is None:
+                return
+            view = JobQueue.describe(current)
+            if view != last:
+                yield f"event: {view['status']}\ndata: {json.dumps(view)}\n\n"
+                last = view
+            if view['status'] in TERMINAL_JOB_STATUSES or time.monotonic() > deadline:
+                return
+            await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(stream(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -2,28 +2,72 @@ import logging
 import os
 from datetime import datetime
 # from pprint import pprint
-from flask import Flask, session, request, jsonify, send_file
+from flask import Flask, session, request, jsonify, Response
 from flask_cors import CORS
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import NotFoundError
+from openai_client import get_openai_client, get_client_metrics
 from messages import SLIDE_TYPES_ENGLISH, SLIDE_TYPES_NORWEGIAN
 
-import PyPDF2
-from docx import Document
 import time
 from database import DatabaseManager
 from s3_manager import S3Manager
+from run_waiter import wait_for_run, get_run_reply
+from run_scheduler import run_scheduler
+from chat_engine import use_chat_backend, complete_chat, CHAT_MODEL
+from translation import translate_slides
+from rate_limiter import get_rate_governor, estimate_tokens, reported_tokens, RATE_LIMIT_COMPLETION_ESTIMATE
+from corpus import build_corpus, count_tokens
+from context_builder import ContextBuilder
+from document_extraction import (
+    SUPPORTED_EXTENSIONS, ExtractionMemoryError, ExtractionTimeout, UnsupportedDocumentError,
+    file_extension, iter_document_text
+)
+from vector_store import VectorStore
+from jobs import JobQueue, PermanentJobError, TERMINAL_JOB_STATUSES
+from cache import LRUCache
 import secrets  # Add this import for token generation
 # from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase.pdfmetrics import stringWidth
+from text_layout import draw_text_paragraph
 
+import io
+import json
 import tempfile
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 load_dotenv()
 assistant_id = os.getenv('ASSISTANT_ID')
+# Upper bound on concurrent slide generations per batch request
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '4'))
+# Threads shared by all requests for ingesting uploads (extraction dispatch and S3 upload)
+S3_UPLOAD_THREADS = int(os.getenv('S3_UPLOAD_THREADS', '8'))
+UPLOAD_READ_CHUNK_BYTES = 1024 * 1024
+# Rendered PDF exports kept in memory, and optionally persisted to S3 for other workers
+PDF_CACHE_BYTES = int(os.getenv('PDF_CACHE_BYTES', str(64 * 1024 * 1024)))
+PDF_EXPORT_S3_CACHE = os.getenv('PDF_EXPORT_S3_CACHE', 'false').lower() == 'true'
+# Bump when the PDF layout changes so cached exports are re-rendered
+PDF_RENDER_VERSION = 2
+# Bump when the slide or edit prompt templates change so cached slides are regenerated
+PROMPT_TEMPLATE_VERSION = 1
+# Generated slides kept in memory in front of the shared MongoDB result cache
+SLIDE_CACHE_BYTES = int(os.getenv('SLIDE_CACHE_BYTES', str(16 * 1024 * 1024)))
+# A project thread whose runs re-read more prompt tokens than this is compacted into a fresh thread
+THREAD_COMPACT_TOKENS = int(os.getenv('THREAD_COMPACT_TOKENS', '60000'))
+# A compaction that hasn't finished after this long may be requested again
+THREAD_COMPACT_RETRY_AFTER = float(os.getenv('THREAD_COMPACT_RETRY_AFTER', '3600'))
+# Latest messages of the old thread that go into its summary, and how much of each
+THREAD_SUMMARY_MESSAGES = int(os.getenv('THREAD_SUMMARY_MESSAGES', '20'))
+THREAD_SUMMARY_MESSAGE_CHARS = int(os.getenv('THREAD_SUMMARY_MESSAGE_CHARS', '4000'))
+# Replaced threads are deleted after this delay, once requests holding the old thread_id are done
+THREAD_RETIRE_DELAY = float(os.getenv('THREAD_RETIRE_DELAY', '900'))
+# Job progress streams check the job this often and close after JOB_EVENTS_TIMEOUT
+JOB_EVENTS_POLL_INTERVAL = float(os.getenv('JOB_EVENTS_POLL_INTERVAL', '0.5'))
+JOB_EVENTS_TIMEOUT = float(os.getenv('JOB_EVENTS_TIMEOUT', '600'))
 # Configure logging
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -64,9 +108,40 @@ required_slides_english = {
     "ask": "Ask",
 }
 
-# Add DatabaseManager initialization
-db_manager = DatabaseManager()
-s3_manager = S3Manager()
+# Connected by startup(), so processes that merely import this module (such as
+# spawned extraction workers re-importing it as __mp_main__) stay inert; the
+# first request starts it when app:app is served without calling startup()
+db_manager = None
+s3_manager = None
+job_queue = None
+_startup_lock = threading.Lock()
+upload_executor = ThreadPoolExecutor(max_workers=S3_UPLOAD_THREADS, thread_name_prefix='s3-upload')
+
+_vector_store = None
+_vector_store_failed = False
+_vector_store_lock = threading.Lock()
+
+def get_vector_store():
+    """Connect the shared VectorStore on first use; returns None if Pinecone is unavailable"""
+    global _vector_store, _vector_store_failed
+    with _vector_store_lock:
+        if _vector_store is None and not _vector_store_failed:
+            try:
+                _vector_store = VectorStore(api_key=os.getenv('PINECONE_API_KEY'))
+            except Exception as e:
+                _vector_store_failed = True
+                logging.error(f"Vector store unavailable: {str(e)}")
+        return _vector_store
+
+def embed_corpus_texts(texts):
+    vector_store = get_vector_store()
+    if vector_store is None:
+        return None
+    return vector_store.embed_texts(texts)
+
+context_builder = ContextBuilder(embed_texts=embed_corpus_texts)
+pdf_cache = LRUCache(PDF_CACHE_BYTES, sizeof=len)
+slide_cache = LRUCache(SLIDE_CACHE_BYTES)
 
 def log_session_info(endpoint_name):
     logging.info(f"Session data at {endpoint_name}: {session}")
@@ -88,67 +163,135 @@ def verify_token(f):
         # Remove 'Bearer ' prefix if present
         token = token.replace('Bearer ', '')
         
-        # Verify token exists in database
+        # Verify token exists (served from the token cache when hot)
         project = db_manager.get_project_by_token(token)
         if not project:
             return jsonify({'error': 'Invalid token'}), 401
             
-        # Add project info to request context
+        # Add project info to request context; handlers reuse it instead of re-reading
+        request.token = token
         request.project = project
         return f(*args, **kwargs)
     return decorated_function
 
+def refresh_request_project():
+    """Re-read the request's project from MongoDB, bypassing the token cache"""
+    project = db_manager.get_project_by_token(request.token, use_cache=False)
+    if project:
+        request.project = project
+    return project
+
 @app.route('/delete_project', methods=['POST'])
 @verify_token
 def delete_project():
-    project = request.project
+    # Read the documents fresh so every shared blob reference gets released
+    project = refresh_request_project() or request.project
     project_id = project['project_id']
     
     logging.info(f"Attempting to delete project: {project_id}")
     
     try:
-        # Delete project and all associated data
-        success = db_manager.delete_project(project_id)
-        
-        # Wait a moment to ensure deletion is processed
-        time.sleep(0.5)
-        
-        # Verify deletion
-        verification = db_manager.get_project(project_id)
-        if verification:
-            logging.error(f"Project still exists after deletion: {project_id}")
-            # Try one more time
-            db_manager.delete_project(project_id)
-            time.sleep(0.5)
-            
-            # Final verification
-            final_check = db_manager.get_project(project_id)
-            if final_check:
-                return jsonify({'error': 'Project deletion failed - project still exists'}), 500
-            
-        if success:
-            # Also delete associated documents from S3
-            try:
-                s3_manager.delete_project_documents(project_id)
-            except Exception as s3_error:
-                logging.error(f"Error deleting S3 documents: {str(s3_error)}")
-                # Continue even if S3 deletion fails
-                
-            logging.info(f"Successfully deleted project: {project_id}")
-            return jsonify({
-                'status': 'success', 
-                'message': 'Project deleted',
-                'project_id': project_id,
-                'verified': True
-            })
-        else:
+        # The soft delete is a single conditional write, so no re-check is needed
+        if not db_manager.delete_project(project_id):
             logging.error(f"Database deletion failed for project: {project_id}")
             return jsonify({'error': 'Failed to delete project from database'}), 500
-            
     except Exception as e:
         logging.error(f"Error deleting project: {str(e)}")
         return jsonify({'error': f'Error deleting project: {str(e)}'}), 500
 
+    logging.info(f"Successfully deleted project: {project_id}")
+    return jsonify({
+        'status': 'success', 
+        'message': 'Project deleted',
+        'project_id': project_id,
+        'cleanup_job_id': enqueue_project_cleanup(project)
+    })
+
+def enqueue_project_cleanup(project):
+    """Queue removal of a deleted project's storage, vectors and thread; returns the job id"""
+    payload = {
+        'thread_id': project.get('thread_id'),
+        'shared_blobs': [doc['content_hash'] for doc in project.get('documents', []) if doc.get('shared_blob')]
+    }
+    try:
+        return job_queue.enqueue('cleanup_project', payload, project_id=project['project_id'])
+    except Exception as e:
+        # The project is already deleted; its leftovers only cost storage
+        logging.error(f"Error queueing cleanup for project {project['project_id']}: {str(e)}")
+        return None
+
+def delete_project_vectors(project_id):
+    vector_store = get_vector_store()
+    if vector_store is None:
+        logging.warning(f"Vector store unavailable; skipping vector cleanup for {project_id}")
+        return
+    if not vector_store.clear_project_data(project_id):
+        raise RuntimeError('Failed to delete vector namespaces')
+
+def delete_openai_thread(thread_id):
+    if not thread_id:
+        return
+    try:
+        get_openai_client().beta.threads.delete(thread_id)
+    except NotFoundError:
+        pass
+
+def ensure_project_deleted(project_id):
+    # create_project refuses to revive an ID while its cleanup is unfinished;
+    # this guards the storage the revived project shares if one slips through
+    if db_manager.get_project(project_id):
+        raise PermanentJobError(f"Project {project_id} was re-created; not deleting its data")
+
+def cleanup_project_job(job):
+    """Remove a deleted project's S3 objects, vector namespaces and OpenAI thread in parallel.
+
+    Steps that finished are recorded in the job progress and skipped when a
+    failed or interrupted cleanup is retried.
+    """
+    project_id = job.project_id
+    ensure_project_deleted(project_id)
+    # Release ids make the refcount decrements safe to repeat on retry
+    orphaned_blobs = [content_hash for index, content_hash in enumerate(job.payload.get('shared_blobs', []))
+                      if db_manager.release_blob(content_hash, release_id=f"{job.job_id}:{index}")]
+
+    def delete_documents():
+        ensure_project_deleted(project_id)
+        s3_manager.delete_project_documents(
+            project_id, orphaned_blobs, on_progress=lambda deleted: job.report(s3_objects_deleted=deleted)
+        )
+
+    def delete_vectors():
+        ensure_project_deleted(project_id)
+        delete_project_vectors(project_id)
+
+    steps = {
+        's3': delete_documents,
+        'vectors': delete_vectors,
+        'thread': lambda: delete_openai_thread(job.payload.get('thread_id'))
+    }
+    completed = list(job.progress.get('completed_steps', []))
+    pending = {name: step for name, step in steps.items() if name not in completed}
+
+    errors = []
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            futures = {executor.submit(step): name for name, step in pending.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    future.result()
+                    completed.append(name)
+                    job.report(completed_steps=completed)
+                except Exception as e:
+                    logging.error(f"Cleanup step {name} failed for project {project_id}: {str(e)}")
+                    errors.append(f"{name}: {str(e)}")
+    if errors:
+        raise RuntimeError('; '.join(errors))
+
+    for content_hash in orphaned_blobs:
+        db_manager.forget_blob(content_hash)
+    return {'completed_steps': completed, 'released_blobs': len(job.payload.get('shared_blobs', []))}
+
 @app.route('/create_project', methods=['POST'])
 def create_project():
     project_id = request.json.get('project_id')
@@ -172,11 +315,15 @@ def create_project():
             'project_id': project_id
         })
 
+    # A deleted project keeps its ID until its storage and vectors are removed
+    if job_queue.has_unfinished('cleanup_project', project_id):
+        return jsonify({'error': 'Project is still being deleted, try again shortly'}), 409
+
     # Generate secure token for new project
     token = generate_secure_token()
     
     # Create new thread
-    thread_id = OpenAI(api_key=os.getenv('OPENAI_API_KEY')).beta.threads.create().id
+    thread_id = get_openai_client().beta.threads.create().id
     
     # Create project in database with token
     try:
@@ -200,49 +347,172 @@ def upload_documents():
         return jsonify({'error': 'No documents provided'}), 400
 
     files = request.files.getlist('documents')
-    processed_documents = []
-
-    for file in files:
-        filename = file.filename
-        file_ext = filename.split('.')[-1].lower()
+    results = [{'filename': file.filename, 'status': 'pending'} for file in files]
+
+    # Files are spooled to disk so extraction workers can read them without
+    # copying the whole upload through the process pool, and hashed on the way
+    uploads = {}
+    for index, file in enumerate(files):
+        if file_extension(file.filename) not in SUPPORTED_EXTENSIONS:
+            results[index].update(status='skipped', error='Unsupported file type')
+            continue
+        fd, path = tempfile.mkstemp(suffix=f'.{file_extension(file.filename)}')
+        digest = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: file.stream.read(UPLOAD_READ_CHUNK_BYTES), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        uploads[upload_executor.submit(ingest_upload, project_id, file.filename, path, digest.hexdigest())] = index
+
+    metadata = {}
+    for future in as_completed(uploads):
+        index = uploads[future]
+        try:
+            metadata[index] = future.result()
+            results[index]['status'] = 'processed'
+        except Exception as e:
+            logging.error(f"Error processing file {results[index]['filename']}: {str(e)}")
+            results[index].update(status='failed', error=str(e))
 
+    # Keep the upload order and store all metadata with a single $each push
+    processed_documents = [metadata[index] for index in sorted(metadata)]
+    if processed_documents:
+        db_manager.update_project_documents(project_id, processed_documents)
         try:
-            if file_ext == 'pdf':
-                # Read PDF content
-                pdf_reader = PyPDF2.PdfReader(file)
-                content = ' '.join(page.extract_text() for page in pdf_reader.pages)
-            elif file_ext == 'docx':
-                # Read DOCX content
-                doc = Document(file)
-                content = ' '.join(paragraph.text for paragraph in doc.paragraphs)
-            elif file_ext == 'txt':
-                # Read TXT content
-                content = file.read().decode('utf-8')
-            else:
-                continue
+            rebuild_project_corpus(project_id, project.get('corpus'))
+        except Exception as e:
+            # The push dropped the stale corpus, so slide generation reads the documents individually
+            logging.error(f"Error building corpus for project {project_id}: {str(e)}")
+        return jsonify({
+            'status': 'success',
+            'message': f'{len(processed_documents)} documents processed',
+            'documents': results
+        })
+    else:
+        return jsonify({'error': 'No valid documents were processed', 'documents': results}), 400
 
-            # Upload to S3
-            s3_key = s3_manager.upload_document(project_id, filename, content)
-            
-            # Store metadata in MongoDB
-            document_metadata = {
-                'filename': filename,
-                'file_type': file_ext,
-                's3_key': s3_key,
-                'uploaded_at': datetime.now().isoformat()
-            }
-            
-            db_manager.add_document(project_id, document_metadata)
-            processed_documents.append(document_metadata)
+def extract_to_s3(filename, path, store):
+    # Page text is streamed to S3 as it is extracted; PDFs are split into
+    # page ranges across the extraction processes under time and memory limits
+    try:
+        with open(path, 'rb') as original:
+            return store(iter_document_text(filename, path), original)
+    except (ExtractionTimeout, ExtractionMemoryError, UnsupportedDocumentError) as e:
+        raise RuntimeError(f'Extraction failed: {str(e)}')
+    except Exception as e:
+        raise RuntimeError(f'Upload failed: {str(e)}')
+
+def ingest_upload(project_id, filename, path, content_hash):
+    """Extract and store one spooled upload, removing the spool file; returns its document metadata"""
+    # Identical uploads share one content-addressed blob, so extraction and
+    # storage happen once per distinct file across all projects
+    blob = db_manager.acquire_blob(content_hash)
+    try:
+        if blob and blob.get('status') == 'ready':
+            logging.info(f"Reusing stored blob {content_hash} for {filename}")
+            keys = blob['keys']
+        elif blob:
+            # A concurrent upload of the same file may be storing it too; both
+            # write identical objects to the same keys
+            keys = extract_to_s3(filename, path, lambda chunks, original:
+                                 s3_manager.upload_blob(content_hash, chunks, original))
+            db_manager.mark_blob_ready(content_hash, keys)
+        else:
+            keys = extract_to_s3(filename, path, lambda chunks, original: {
+                'text': s3_manager.upload_document_stream(project_id, filename, chunks),
+                'original': s3_manager.upload_original(project_id, filename, original)
+            })
+    except Exception:
+        if blob and db_manager.release_blob(content_hash):
+            try:
+                s3_manager.delete_blob(content_hash)
+                db_manager.forget_blob(content_hash)
+            except Exception as e:
+                logging.error(f"Error deleting blob {content_hash}: {str(e)}")
+        raise
+    finally:
+        os.remove(path)
+
+    return {
+        'filename': filename,
+        'file_type': file_extension(filename),
+        's3_key': keys['text'],
+        'original_s3_key': keys['original'],
+        'content_hash': content_hash,
+        # Only shared blobs hold a reference that project deletion must release
+        'shared_blob': blob is not None,
+        'uploaded_at': datetime.now().isoformat()
+    }
+
+def rebuild_project_corpus(project_id, previous=None):
+    """Build the normalized corpus for all project documents and store it in S3.
+
+    The documents are read fresh, so concurrent uploads each build from the
+    full list; `previous` is the corpus the upload replaced.
+    """
+    project = db_manager.get_project(project_id)
+    if not project:
+        return None
+    documents = project.get('documents', [])
+    # Re-uploads reuse the same key, so read each key once
+    s3_keys = list(dict.fromkeys(doc['s3_key'] for doc in documents))
+    corpus = build_corpus(s3_manager.get_document(key) for key in s3_keys)
+    text = corpus.pop('text')
+    corpus['s3_key'] = s3_manager.upload_corpus(project_id, corpus['content_hash'], text)
+    if not db_manager.update_project_corpus(project_id, corpus, len(documents)):
+        # Another upload added documents meanwhile and rebuilds with them
+        logging.warning(f"Documents of project {project_id} changed during corpus build")
+        return None
 
+    if previous and previous.get('s3_key') != corpus['s3_key']:
+        try:
+            s3_manager.delete_document(previous['s3_key'])
         except Exception as e:
-            logging.error(f"Error processing file {filename}: {str(e)}")
-            continue
+            logging.error(f"Error deleting previous corpus {previous['s3_key']}: {str(e)}")
+    return corpus
 
-    if processed_documents:
-        return jsonify({'status': 'success', 'message': f'{len(processed_documents)} documents processed'})
-    else:
-        return jsonify({'error': 'No valid documents were processed'}), 400
+def translate_project_deck(project_id, language):
+    """Switch the project's deck to `language` by translating its slides instead of regenerating them.
+
+    Slides unchanged since the previous switch reuse the translation stored
+    then. Returns (state, report), or None if the project doesn't exist.
+    """
+    project = db_manager.get_project(project_id)
+    if not project:
+        return None
+    state = project['state']
+    source = state.get('current_language', 'en')
+    slides = state.get('slides', {})
+    report = {'translated': [], 'reused': [], 'failed': {}}
+    if source == language:
+        return state, report
+
+    variants = state.get('slide_variants', {})
+    source_variant = variants.get(source, {})
+    target_variant = variants.get(language, {})
+    reused = [name for name, text in slides.items()
+              if source_variant.get(name) == text and name in target_variant]
+    pending = {name: text for name, text in slides.items()
+               if name not in reused and isinstance(text, str) and text.strip()}
+    translations, errors = translate_slides(pending, source, language) if pending else ({}, {})
+
+    new_slides = {}
+    for name, text in slides.items():
+        if name in reused:
+            new_slides[name] = target_variant[name]
+        else:
+            # Slides that could not be translated keep their text until edited or regenerated
+            new_slides[name] = translations.get(name, text)
+    translated_variant = {name: text for name, text in new_slides.items() if name not in errors}
+
+    changed = db_manager.apply_translation(project_id, language, slides, new_slides,
+                                           {source: slides, language: translated_variant})
+    for name in changed:
+        errors[name] = 'changed during translation'
+    project = db_manager.get_project(project_id) or project
+    report.update(translated=[name for name in translations if name not in changed],
+                  reused=[name for name in reused if name not in changed], failed=errors)
+    return project['state'], report
 
 @app.route('/set_language', methods=['POST'])
 @verify_token
@@ -251,7 +521,22 @@ def set_language():
     project_id = project['project_id']
     language = request.json.get('language')
     
-    if language in ['en', 'no']:
+    if language in ['en', 'no'] and request.json.get('translate'):
+        try:
+            result = translate_project_deck(project_id, language)
+            if not result:
+                return jsonify({'error': 'Project not found'}), 404
+            state, report = result
+            return jsonify({
+                'status': 'success',
+                'message': f'Language set to {language}',
+                'state': state,
+                'translation': report
+            })
+        except Exception as e:
+            logging.error(f"Error translating deck: {str(e)}")
+            return jsonify({'error': f'Error translating deck: {str(e)}'}), 500
+    elif language in ['en', 'no']:
         try:
             # Update language in database
             success = db_manager.update_project_language(project_id, language)
@@ -277,13 +562,12 @@ def generate_slides():
     project = request.project
     project_id = project['project_id']
     slide = request.json.get('slide')
-    
-    # Get project from database
-    project = db_manager.get_project(project_id)
-    if not project:
-        return jsonify({'error': 'Project not found'}), 404
 
     documents = project.get('documents', [])
+    if not documents:
+        # The upload may have been handled by another worker after this token was cached
+        project = refresh_request_project() or project
+        documents = project.get('documents', [])
     thread_id = project.get('thread_id')
 
     if not documents:
@@ -292,143 +576,509 @@ def generate_slides():
     if not slide:
         return jsonify({'error': "No slide specified"}), 400
 
-    slide_content = process_slide(documents, thread_id, slide, assistant_id)
+    force_regenerate = bool(request.json.get('force_regenerate'))
+    if request.json.get('async'):
+        # Generated by a job worker; poll /jobs/<job_id> or stream /jobs/<job_id>/events
+        job_id = job_queue.enqueue('generate_slide', {'slide': slide, 'force_regenerate': force_regenerate},
+                                   project_id=project_id)
+        return jsonify({'status': 'queued', 'job_id': job_id}), 202
+
+    language = project['state'].get('current_language', 'en')
+
+    def generate():
+        doc_content = load_document_content(project)
+        return process_slide(documents, thread_id, slide, assistant_id, language,
+                             doc_content=doc_content,
+                             corpus_hash=project.get('corpus', {}).get('content_hash'),
+                             token_count=project.get('corpus', {}).get('token_count'),
+                             project_id=project_id)
+
+    try:
+        slide_content, cached = generate_slide_cached(project, slide, language, generate, force_regenerate)
+    except Exception as e:
+        logging.error(f"Error loading documents: {str(e)}")
+        return jsonify({'error': f'Error loading documents: {str(e)}'}), 500
+
     if slide_content:
         # Store slide content in database
         db_manager.update_slide_content(project_id, slide, slide_content)
-        return jsonify({'status': 'completed', 'content': slide_content})
+        return jsonify({'status': 'completed', 'content': slide_content, 'cached': cached})
     else:
         return jsonify({'error': 'Failed to generate slide content'}), 500
 
-def process_slide(documents, thread_id, slide, assistant_id):
-    try:
-        # Get document contents from S3
-        doc_contents = []
-        for doc in documents:
-            content = s3_manager.get_document(doc['s3_key'])
-            doc_contents.append(content)
+@app.route('/generate_slides_batch', methods=['POST'])
+@verify_token
+def generate_slides_batch():
+    project = request.project
+    project_id = project['project_id']
+    slides = request.json.get('slides') or []
 
-        doc_content = ' '.join(doc_contents)
-        logging.info(f"Processing slide: {slide}")
-        
-        # Get project from request context
-        project = request.project
-        language = project['state'].get('current_language', 'en')
-        
-        slide_config = SLIDE_TYPES_ENGLISH if language == "en" else SLIDE_TYPES_NORWEGIAN
-        slide_name = slide.lower().replace(' ', '_')
-        print('the slide name is: ', slide_name)
-        config = slide_config.get(slide_name, None)
+    documents = project.get('documents', [])
+    if not documents:
+        # The upload may have been handled by another worker after this token was cached
+        project = refresh_request_project() or project
+        documents = project.get('documents', [])
+    if not documents:
+        return jsonify({'error': "No documents provided"}), 400
 
-        if not config:
-            logging.error(f"Slide configuration not found for: {slide}")
-            return None
+    if not slides:
+        return jsonify({'error': "No slides specified"}), 400
 
-        message_content = format_slide_content(config, doc_content)
-        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user", 
-            content=message_content
-        )
+    language = project['state'].get('current_language', 'en')
+    force_regenerate = bool(request.json.get('force_regenerate'))
+
+    results = {}
+    errors = {}
+    pending = []
+    for slide in slides:
+        cache_key = slide_cache_key(slide, language, project_corpus_hash(project))
+        slide_content = None if force_regenerate else get_cached_slide(cache_key)
+        if slide_content:
+            db_manager.update_slide_content(project_id, slide, slide_content)
+            results[slide] = slide_content
+        else:
+            pending.append((slide, cache_key))
 
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id
-        )
+    if pending:
+        try:
+            # Read the documents once for the whole batch instead of once per slide
+            doc_content = load_document_content(project)
+        except Exception as e:
+            logging.error(f"Error loading documents: {str(e)}")
+            return jsonify({'error': f'Error loading documents: {str(e)}'}), 500
+    corpus_hash = project.get('corpus', {}).get('content_hash')
+    token_count = project.get('corpus', {}).get('token_count')
+
+    def generate(slide, cache_key):
+        if use_chat_backend():
+            slide_content = process_slide(documents, None, slide, assistant_id, language,
+                                          doc_content=doc_content, corpus_hash=corpus_hash, token_count=token_count,
+                                          project_id=project_id)
+        else:
+            # Each slide runs on its own thread so the runs don't queue behind
+            # each other on the project's thread
+            client = get_openai_client()
+            thread_id = client.beta.threads.create().id
+            try:
+                slide_content = process_slide(documents, thread_id, slide, assistant_id, language,
+                                              doc_content=doc_content, corpus_hash=corpus_hash, token_count=token_count,
+                                              project_id=project_id)
+            finally:
+                try:
+                    client.beta.threads.delete(thread_id)
+                except Exception as e:
+                    logging.error(f"Error deleting batch thread {thread_id}: {str(e)}")
+
+        if slide_content:
+            cache_slide_result(cache_key, slide, language, slide_content)
+            # Store each slide as soon as it is ready
+            db_manager.update_slide_content(project_id, slide, slide_content)
+        return slide_content
+
+    with ThreadPoolExecutor(max_workers=max(min(BATCH_MAX_WORKERS, len(pending)), 1)) as executor:
+        futures = {executor.submit(generate, slide, cache_key): slide for slide, cache_key in pending}
+        for future in as_completed(futures):
+            slide = futures[future]
+            try:
+                slide_content = future.result()
+            except Exception as e:
+                logging.error(f"Error generating slide {slide}: {str(e)}")
+                slide_content = None
+            if slide_content:
+                results[slide] = slide_content
+            else:
+                errors[slide] = 'Failed to generate slide content'
+
+    if not results:
+        return jsonify({'error': 'Failed to generate slide content', 'errors': errors}), 500
+
+    return jsonify({
+        'status': 'completed' if not errors else 'partial',
+        'content': results,
+        'errors': errors
+    })
+
+def join_documents(documents):
+    """Read and join the contents of all project documents from S3"""
+    doc_contents = []
+    for doc in documents:
+        content = s3_manager.get_document(doc['s3_key'])
+        doc_contents.append(content)
+    return ' '.join(doc_contents)
+
+def load_document_content(project):
+    """Load the project's document text, preferring the prebuilt corpus"""
+    corpus = project.get('corpus')
+    if corpus and corpus.get('s3_key'):
+        try:
+            return s3_manager.get_document(corpus['s3_key'])
+        except Exception as e:
+            logging.error(f"Error loading corpus for project {project['project_id']}: {str(e)}")
+    return join_documents(project.get('documents', []))
+
+def build_slide_message(slide, language, doc_content, corpus_hash=None, token_count=None):
+    """Build the generation prompt for a slide, or None if the slide type is unknown"""
+    slide_config = SLIDE_TYPES_ENGLISH if language == "en" else SLIDE_TYPES_NORWEGIAN
+    config = slide_config.get(slide.lower().replace(' ', '_'), None)
+    if not config:
+        logging.error(f"Slide configuration not found for: {slide}")
+        return None
 
-        while run.status in ["queued", "in_progress"]:
-            time.sleep(0.5)
-            run = client.beta.threads.runs.retrieve(
+    # Only the most relevant part of a large corpus goes into the prompt
+    context = context_builder.build(doc_content, config, corpus_hash, token_count)
+    return format_slide_content(config, context, language)
+
+def project_corpus_hash(project):
+    """Identify the project's document content without reading it, or None for legacy documents"""
+    # Derived from the documents themselves, so it changes with every upload
+    # even while the stored corpus is missing or being rebuilt
+    hashes = [doc.get('content_hash') for doc in project.get('documents', [])]
+    if hashes and all(hashes):
+        return hashlib.sha256(':'.join(hashes).encode('utf-8')).hexdigest()
+    return None
+
+def generation_model_id():
+    return f"chat:{CHAT_MODEL}" if use_chat_backend() else assistant_id
+
+def slide_cache_key(slide, language, corpus_hash):
+    """Hash everything a generated slide depends on; None if the corpus can't be identified"""
+    if not corpus_hash:
+        return None
+    slide_key = slide.lower().replace(' ', '_')
+    slide_config = SLIDE_TYPES_ENGLISH if language == "en" else SLIDE_TYPES_NORWEGIAN
+    payload = json.dumps({
+        'version': PROMPT_TEMPLATE_VERSION,
+        'corpus': corpus_hash,
+        'slide': slide_key,
+        'config': slide_config.get(slide_key),
+        'model': generation_model_id(),
+        'language': language
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def get_cached_slide(cache_key):
+    if not cache_key:
+        return None
+    content = slide_cache.get(cache_key)
+    if content is None:
+        try:
+            content = db_manager.get_cached_slide(cache_key)
+        except Exception as e:
+            logging.error(f"Error reading slide cache: {str(e)}")
+        if content:
+            slide_cache.put(cache_key, content)
+    return content
+
+def cache_slide_result(cache_key, slide, language, content):
+    if not cache_key:
+        return
+    slide_cache.put(cache_key, content)
+    try:
+        db_manager.cache_slide(cache_key, content, slide, language)
+    except Exception as e:
+        logging.error(f"Error storing slide in cache: {str(e)}")
+
+def generate_slide_cached(project, slide, language, generate, force_regenerate=False):
+    """Return (content, cached), calling generate() only if no earlier result matches the prompt"""
+    cache_key = slide_cache_key(slide, language, project_corpus_hash(project))
+    if not force_regenerate:
+        content = get_cached_slide(cache_key)
+        if content:
+            logging.info(f"Serving slide {slide} from the result cache")
+            return content, True
+    content = generate()
+    if content:
+        cache_slide_result(cache_key, slide, language, content)
+    return content, False
+
+def run_assistant(thread_id, message_content, resume_run_id=None, on_run=None, project_id=None):
+    """Post a message to the thread, run the assistant and return its reply, or None on failure.
+
+    With resume_run_id (saved through on_run by an earlier attempt) a run
+    that is still going or already completed is picked up instead of paying
+    for a new one. Runs on the same thread wait their turn in run_scheduler,
+    since the thread rejects messages while a run is active.
+    """
+    return run_scheduler.run(thread_id, _run_assistant, thread_id, message_content,
+                             resume_run_id, on_run, project_id, project_id=project_id)
+
+def _run_assistant(thread_id, message_content, resume_run_id, on_run, project_id):
+    client = get_openai_client()
+    run = None
+    if resume_run_id:
+        try:
+            run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=resume_run_id)
+            if run.status not in ("queued", "in_progress", "completed"):
+                run = None
+        except Exception as e:
+            logging.warning(f"Cannot resume run {resume_run_id}: {str(e)}")
+            run = None
+
+    if run is None:
+        # Charged up front, then settled against the tokens the run really used
+        estimate = estimate_tokens(message_content, completion=RATE_LIMIT_COMPLETION_ESTIMATE)
+        with get_rate_governor('assistant').admit(estimate) as grant:
+            client.beta.threads.messages.create(
                 thread_id=thread_id,
-                run_id=run.id
+                role="user", 
+                content=message_content
             )
 
-        if run.status == "completed":
-            messages = client.beta.threads.messages.list(
-                thread_id=thread_id
+            run = client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id
             )
-            
-            response = messages.data[0].content[0].text.value
-            cleaned_response = response
-            
-            slide_content = {
-                'content': cleaned_response,
-                'slide_name': config['name'],
-                'status': 'completed'
-            }
-            logging.info(f"Slide content: {slide_content}")
-            return slide_content['content']
-        else:
-            logging.error("Failed to generate slide content")
+            if on_run:
+                on_run(run.id)
+
+            run = wait_for_run(client, thread_id, run)
+            grant.usage = reported_tokens(run)
+    else:
+        run = wait_for_run(client, thread_id, run)
+
+    if run.status == "completed":
+        record_thread_usage(project_id, thread_id, run)
+        return get_run_reply(client, thread_id, run.id)
+    else:
+        logging.error("Failed to generate slide content")
+        return None
+
+def generate_reply(thread_id, message_content, resume_run_id=None, on_run=None, project_id=None):
+    """Answer a slide or edit prompt with the configured GENERATION_BACKEND"""
+    if use_chat_backend():
+        # The prompt carries everything the reply needs, so no thread is involved
+        return complete_chat(message_content)
+    return run_assistant(thread_id, message_content, resume_run_id=resume_run_id, on_run=on_run,
+                         project_id=project_id)
+
+def process_slide(documents, thread_id, slide, assistant_id, language='en', doc_content=None, corpus_hash=None,
+                  token_count=None, resume_run_id=None, on_run=None, project_id=None):
+    try:
+        # Get document contents from S3
+        if doc_content is None:
+            doc_content = join_documents(documents)
+        logging.info(f"Processing slide: {slide}")
+        message_content = build_slide_message(slide, language, doc_content, corpus_hash, token_count)
+        if not message_content:
             return None
+
+        response = generate_reply(thread_id, message_content, resume_run_id=resume_run_id, on_run=on_run,
+                                  project_id=project_id)
+        logging.info(f"Slide content: {response}")
+        return response
     except Exception as e:
         logging.error(f"Error processing slide: {str(e)}")
         return None
 
-@app.route('/edit_slide', methods=['POST'])
-@verify_token
-def edit_slide():
-    project = request.project
-    slide = request.json.get('slide').lower().replace(' ', '_')
-    edit_request = request.json.get('edit_request')
-    
-    # Get current slide content from database
+def edit_slide_content(project, slide, edit_request, resume_run_id=None, on_run=None):
+    """Apply an edit request to a stored slide; returns the new content, or None if the slide doesn't exist"""
     current_content = db_manager.get_slide_content(project['project_id'], slide)
     if not current_content:
-        return jsonify({'error': 'Slide not found'}), 404
+        return None
 
     logging.info(f"Received edit request: {edit_request} for slide: {slide}")
     message_content = get_edit_prompt(project['state']['current_language'], edit_request, current_content)
     logging.info(f"Generated message content: {message_content}")
-    thread_id = project['thread_id']
 
-    try:
-        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        client.beta.threads.messages.create(
-            thread_id=thread_id,
-            role="user", 
-            content=message_content
-        )
+    response = generate_reply(project['thread_id'], message_content, resume_run_id=resume_run_id, on_run=on_run,
+                              project_id=project['project_id'])
+    if not response:
+        raise RuntimeError('Failed to generate slide content')
 
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id
-        )
+    # Update slide content in database
+    db_manager.update_slide_content(project['project_id'], slide, response)
+    logging.info(f"Slide content updated: {response}")
+    return response
 
-        while run.status in ["queued", "in_progress"]:
-            time.sleep(0.5)
-            run = client.beta.threads.runs.retrieve(
-                thread_id=thread_id,
-                run_id=run.id
-            )
+@app.route('/edit_slide', methods=['POST'])
+@verify_token
+def edit_slide():
+    project = request.project
+    slide = request.json.get('slide').lower().replace(' ', '_')
+    edit_request = request.json.get('edit_request')
 
-        if run.status == "completed":
-            messages = client.beta.threads.messages.list(
-                thread_id=thread_id
-            )
-            
-            response = messages.data[0].content[0].text.value
-            cleaned_response = response
-            
-            slide_content = {
-                'content': cleaned_response,
-                'status': 'completed'
-            }
-            
-            # Update slide content in database
-            db_manager.update_slide_content(project['project_id'], slide, cleaned_response)
-            
-            logging.info(f"Slide content updated: {slide_content}")
-            return jsonify({'status': 'completed', 'content': slide_content})
-        else:
-            logging.error("Failed to generate slide content")
-            return jsonify({'error': 'Failed to generate slide content'}), 500
+    if request.json.get('async'):
+        if not db_manager.get_slide_content(project['project_id'], slide):
+            return jsonify({'error': 'Slide not found'}), 404
+        job_id = job_queue.enqueue('edit_slide', {'slide': slide, 'edit_request': edit_request},
+                                   project_id=project['project_id'])
+        return jsonify({'status': 'queued', 'job_id': job_id}), 202
 
+    try:
+        content = edit_slide_content(project, slide, edit_request)
+        if content is None:
+            return jsonify({'error': 'Slide not found'}), 404
+        return jsonify({'status': 'completed', 'content': {'content': content, 'status': 'completed'}})
     except Exception as e:
         logging.error(f"Error editing slide: {str(e)}")
         return jsonify({'error': f'Error editing slide: {str(e)}'}), 500
 
+def job_project(job):
+    project = db_manager.get_project(job.project_id)
+    if not project:
+        raise PermanentJobError(f"Project not found: {job.project_id}")
+    return project
+
+def save_run_id(job):
+    # Lets a retry after a crash pick up the run instead of starting another
+    return lambda run_id: job.report(stage='running', run_id=run_id)
+
+def generate_slide_job(job):
+    project = job_project(job)
+    slide = job.payload['slide']
+    language = project['state'].get('current_language', 'en')
+
+    def generate():
+        job.report(stage='loading_documents')
+        doc_content = load_document_content(project)
+        return process_slide(project.get('documents', []), project.get('thread_id'), slide, assistant_id, language,
+                             doc_content=doc_content,
+                             corpus_hash=project.get('corpus', {}).get('content_hash'),
+                             token_count=project.get('corpus', {}).get('token_count'),
+                             resume_run_id=job.progress.get('run_id'), on_run=save_run_id(job),
+                             project_id=project['project_id'])
+
+    slide_content, cached = generate_slide_cached(project, slide, language, generate,
+                                                  job.payload.get('force_regenerate', False))
+    if not slide_content:
+        raise RuntimeError('Failed to generate slide content')
+    db_manager.update_slide_content(project['project_id'], slide, slide_content)
+    return {'slide': slide, 'content': slide_content, 'cached': cached}
+
+def edit_slide_job(job):
+    project = job_project(job)
+    slide = job.payload['slide']
+    content = edit_slide_content(project, slide, job.payload['edit_request'],
+                                 resume_run_id=job.progress.get('run_id'), on_run=save_run_id(job))
+    if content is None:
+        raise PermanentJobError(f"Slide not found: {slide}")
+    return {'slide': slide, 'content': content}
+
+THREAD_SUMMARY_PROMPT = """You condense a conversation between a founder and a pitch deck writing assistant.
+Summarize the facts about the company the slides rely on and every preference, correction or change
+the founder asked for, so the assistant can continue without the conversation. Use at most 300 words."""
+
+def record_thread_usage(project_id, thread_id, run):
+    """Track how much of the project's thread each run re-reads, and compact the thread when it grows too large"""
+    usage = getattr(run, 'usage', None)
+    if not project_id or not usage:
+        return
+    try:
+        # Batch runs use their own threads, which don't match the project's
+        if not db_manager.update_thread_tokens(project_id, thread_id, usage.prompt_tokens):
+            return
+        if usage.prompt_tokens >= THREAD_COMPACT_TOKENS and \
+                db_manager.request_thread_compaction(project_id, thread_id, THREAD_COMPACT_RETRY_AFTER):
+            job_queue.enqueue('compact_thread', {'thread_id': thread_id}, project_id=project_id)
+            logging.info(f"Thread of project {project_id} reached {usage.prompt_tokens} tokens; compaction queued")
+    except Exception as e:
+        logging.error(f"Error recording thread usage for project {project_id}: {str(e)}")
+
+def summarize_thread(client, thread_id):
+    messages = client.beta.threads.messages.list(thread_id=thread_id, order='desc', limit=THREAD_SUMMARY_MESSAGES)
+    transcript = []
+    for message in reversed(messages.data):
+        text = ' '.join(part.text.value for part in message.content if part.type == 'text')
+        transcript.append(f"{message.role}: {text[:THREAD_SUMMARY_MESSAGE_CHARS]}")
+    return complete_chat('\n\n'.join(transcript), system=THREAD_SUMMARY_PROMPT, max_tokens=600)
+
+def build_thread_seed(summary, slides, language):
+    slide_texts = '\n\n'.join(f"## {name}\n{slides[name]}" for name in sort_slides(slides, language))
+    return f"""Summary of our conversation so far:
+{summary}
+
+Current slides:
+{slide_texts}
+
+Keep this context in mind for the slide requests that follow."""
+
+def compact_thread_job(job):
+    """Move the project to a fresh thread seeded with a summary of the old one and the current slides.
+
+    Runs in the old thread's run_scheduler queue, so no run of this process
+    adds to the old thread between the summary and the swap. The swap is a
+    compare-and-swap on thread_id; the old thread is deleted by a delayed job.
+    """
+    old_thread_id = job.payload['thread_id']
+    return run_scheduler.run(old_thread_id, compact_thread, job, old_thread_id, project_id=job.project_id)
+
+def compact_thread(job, old_thread_id):
+    project = job_project(job)
+    new_thread_id = job.progress.get('new_thread_id')
+    if project.get('thread_id') == new_thread_id:
+        # Swapped by an attempt that died before retiring the old thread
+        job_queue.enqueue('delete_thread', {'thread_id': old_thread_id}, project_id=job.project_id,
+                          delay=THREAD_RETIRE_DELAY)
+        return {'status': 'compacted', 'thread_id': new_thread_id}
+    if project.get('thread_id') != old_thread_id:
+        delete_openai_thread(new_thread_id)
+        return {'status': 'skipped', 'thread_id': project.get('thread_id')}
+
+    client = get_openai_client()
+    job.report(stage='summarizing')
+    summary = summarize_thread(client, old_thread_id)
+    if not summary:
+        raise RuntimeError('Failed to summarize thread')
+    language = project['state'].get('current_language', 'en')
+    seed = build_thread_seed(summary, project['state'].get('slides', {}), language)
+
+    delete_openai_thread(new_thread_id)
+    new_thread_id = client.beta.threads.create(messages=[{'role': 'user', 'content': seed}]).id
+    job.report(stage='swapping', new_thread_id=new_thread_id)
+    if not db_manager.swap_thread(job.project_id, old_thread_id, new_thread_id, count_tokens(seed)):
+        # The project was deleted or its thread replaced meanwhile
+        delete_openai_thread(new_thread_id)
+        return {'status': 'skipped', 'thread_id': None}
+
+    job_queue.enqueue('delete_thread', {'thread_id': old_thread_id}, project_id=job.project_id,
+                      delay=THREAD_RETIRE_DELAY)
+    logging.info(f"Compacted thread of project {job.project_id} into {new_thread_id}")
+    return {'status': 'compacted', 'thread_id': new_thread_id}
+
+def delete_thread_job(job):
+    delete_openai_thread(job.payload['thread_id'])
+
+def get_project_job(job_id):
+    """Return the job if it belongs to the request's project"""
+    job = job_queue.get(job_id)
+    if not job or job.get('project_id') != request.project['project_id']:
+        return None
+    return job
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@verify_token
+def get_job(job_id):
+    job = get_project_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(JobQueue.describe(job))
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+@verify_token
+def job_events(job_id):
+    job = get_project_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def stream():
+        # Server-sent events: one event per observed change, until the job finishes
+        last = None
+        deadline = time.monotonic() + JOB_EVENTS_TIMEOUT
+        while True:
+            current = job_queue.get(job_id)
+            if current is None:
+                return
+            view = JobQueue.describe(current)
+            if view != last:
+                yield f"event: {view['status']}\ndata: {json.dumps(view)}\n\n"
+                last = view
+            if view['status'] in TERMINAL_JOB_STATUSES or time.monotonic() > deadline:
+                return
+            time.sleep(JOB_EVENTS_POLL_INTERVAL)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 def get_edit_prompt(language, edit_request, current_content):
     """Generate edit prompt based on language"""
     if language == "no":
@@ -454,7 +1104,7 @@ def get_edit_prompt(language, edit_request, current_content):
 
         Please maintain the same format and structure, but incorporate the requested changes."""
 
-def format_slide_content(config, doc_content):
+def format_slide_content(config, doc_content, language='en'):
     """Format slide content based on configuration"""
     message_content_english = f"""
         Create a **{config['name']}** slide for a pitch deck using the provided company documents and the following detailed instructions.
@@ -519,21 +1169,30 @@ def format_slide_content(config, doc_content):
         {config['prompt']}
         """
 
-    # Get project from request context
-    project = request.project
-    language = project['state'].get('current_language', 'en')
-    
     return message_content_english if language == "en" else message_content_norwegian
 
 @app.route('/test_cors', methods=['GET'])
 def test_cors():
     return jsonify({'message': 'CORS is working!'})
 
+@app.route('/metrics/openai', methods=['GET'])
+def openai_metrics():
+    return jsonify(get_client_metrics())
+
+@app.route('/metrics/runs', methods=['GET'])
+def run_metrics():
+    return jsonify(run_scheduler.stats())
+
+@app.route('/run_queue', methods=['GET'])
+@verify_token
+def run_queue():
+    """Assistant runs waiting on or holding the project's threads in this worker"""
+    return jsonify(run_scheduler.stats(request.project['project_id']))
+
 @app.route('/download_pdf', methods=['POST'])
 @verify_token
 def download_pdf():
-    token = request.headers.get('Authorization').replace('Bearer ', '')
-    project = db_manager.get_project_by_token(token)
+    project = request.project
     logging.info("Downloading PDF")
     project_id = project['project_id']
     print('the project id is: ', project_id)
@@ -546,72 +1205,104 @@ def download_pdf():
     if not slides:
         return jsonify({'error': 'No slides available for this project'}), 404
     
-    selected_language = project['state']['current_language']
-   
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
-        c = canvas.Canvas(temp_pdf.name, pagesize=A4)
-        width, height = A4
-        margin = 60  # Increased margin for better readability
-        y_position_start = height - margin
-
-        first_page = True  # Track if it's the first page
-        bullet_symbol = "•" if selected_language == "en" else "-"  # Choose bullet symbol based on language
-        # for slide_name in
-        # for slide_name, slide_content in slides.items():
-        for slide_name in slides:
-            # print('the slide_name is: ', slide_name)
-            # slide_name = original_slides[]
-            slide_content = original_slides[slide_name]
-            if not first_page:
-                c.showPage()  # Start a new page for each slide except the first
-            else:
-                first_page = False  # Skip creating a new page for the first slide
-
-            y_position = y_position_start
-
-            # Draw slide title
-            c.setFont("Helvetica-Bold", 20)
-            c.drawString(margin, y_position, slide_name)
-            y_position -= 32  # Space after title
-
-            # Determine slide type and format content accordingly
-            if slide_name.lower() == 'introduction':
-                # Introduction slide with paragraph format
-                for line in slide_content.split('\n'):
-                    if line.strip():
-                        line = line.replace('**', '').strip()
-                        if line.startswith('- '):
-                            line = line[2:]
-
-                        # Adjust x position and max width for bullet points
-                        bullet_indent = margin + 10
-                        bullet_width = width - 2 * margin - 20
-                        c.setFont("Helvetica", 10)
-                        y_position = draw_text_paragraph(
-                            c, f"{bullet_symbol} {line}", y_position, margin, width - 2 * margin,
-                            font="Helvetica", font_size=10, line_height=14
-                        )
-            else:
-                # Bullet point format for other slides
-                for line in slide_content.split('\n'):
-                    if line.strip():
-                        line = line.replace('**', '').strip()
-                        if line.startswith('- '):
-                            line = line[2:]
-
-                        # Adjust x position and max width for bullet points
-                        bullet_indent = margin + 10
-                        bullet_width = width - 2 * margin - 20
-                        c.setFont("Helvetica", 10)
-                        y_position = draw_text_paragraph(
-                            c, f"{bullet_symbol} {line}", y_position, bullet_indent, bullet_width,
-                            font="Helvetica", font_size=10, line_height=14
-                        )
-
-        c.save()
-
-    return send_file(temp_pdf.name, as_attachment=True, download_name=f"{project_id}_slides.pdf")
+    export_hash, pdf_bytes = export_deck_pdf(project_id, language, slides, original_slides)
+
+    return Response(
+        pdf_bytes,
+        mimetype='application/pdf',
+        headers={
+            'Content-Disposition': f'attachment; filename="{project_id}_slides.pdf"',
+            'Content-Length': str(len(pdf_bytes)),
+            'ETag': f'"{export_hash}"'
+        }
+    )
+
+def export_deck_pdf(project_id, language, slide_order, slides):
+    """Return (export_hash, pdf_bytes) for the deck, rendering only on a cache miss"""
+    # Identical decks render to identical PDFs, so exports are cached by content
+    export_hash = pdf_export_hash(language, slide_order, slides)
+    pdf_bytes = pdf_cache.get(export_hash)
+    if pdf_bytes is None and PDF_EXPORT_S3_CACHE:
+        try:
+            pdf_bytes = s3_manager.get_export(project_id, export_hash)
+        except Exception as e:
+            logging.error(f"Error reading cached export: {str(e)}")
+    if pdf_bytes is None:
+        pdf_bytes = render_slides_pdf(slide_order, slides, language)
+        if PDF_EXPORT_S3_CACHE:
+            try:
+                s3_manager.upload_export(project_id, export_hash, pdf_bytes)
+            except Exception as e:
+                logging.error(f"Error persisting export: {str(e)}")
+    pdf_cache.put(export_hash, pdf_bytes)
+    return export_hash, pdf_bytes
+
+def pdf_export_hash(language, slide_order, slides):
+    """Hash everything a rendered export depends on"""
+    payload = json.dumps({
+        'version': PDF_RENDER_VERSION,
+        'language': language,
+        'slides': [[name, slides[name]] for name in slide_order]
+    }, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def render_slides_pdf(slide_order, slides, selected_language):
+    """Render the deck into an in-memory PDF and return its bytes"""
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin = 60  # Increased margin for better readability
+    y_position_start = height - margin
+
+    first_page = True  # Track if it's the first page
+    bullet_symbol = "•" if selected_language == "en" else "-"  # Choose bullet symbol based on language
+    for slide_name in slide_order:
+        slide_content = slides[slide_name]
+        if not first_page:
+            c.showPage()  # Start a new page for each slide except the first
+        else:
+            first_page = False  # Skip creating a new page for the first slide
+
+        y_position = y_position_start
+
+        # Draw slide title
+        c.setFont("Helvetica-Bold", 20)
+        c.drawString(margin, y_position, slide_name)
+        y_position -= 32  # Space after title
+
+        # Determine slide type and format content accordingly
+        if slide_name.lower() == 'introduction':
+            # Introduction slide with paragraph format
+            for line in slide_content.split('\n'):
+                if line.strip():
+                    line = line.replace('**', '').strip()
+                    if line.startswith('- '):
+                        line = line[2:]
+
+                    c.setFont("Helvetica", 10)
+                    y_position = draw_text_paragraph(
+                        c, f"{bullet_symbol} {line}", y_position, margin, width - 2 * margin,
+                        font="Helvetica", font_size=10, line_height=14
+                    )
+        else:
+            # Bullet point format for other slides
+            for line in slide_content.split('\n'):
+                if line.strip():
+                    line = line.replace('**', '').strip()
+                    if line.startswith('- '):
+                        line = line[2:]
+
+                    # Adjust x position and max width for bullet points
+                    bullet_indent = margin + 10
+                    bullet_width = width - 2 * margin - 20
+                    c.setFont("Helvetica", 10)
+                    y_position = draw_text_paragraph(
+                        c, f"{bullet_symbol} {line}", y_position, bullet_indent, bullet_width,
+                        font="Helvetica", font_size=10, line_height=14
+                    )
+
+    c.save()
+    return buffer.getvalue()
 
 from pprint import pprint
 def sort_slides(slides, selected_language):    
@@ -625,31 +1316,31 @@ def sort_slides(slides, selected_language):
     
     return new_slides
 
-def draw_text_paragraph(c, text, y_position, x_position, max_width, font="Helvetica", font_size=10, line_height=14):
-    """
-    Draws a text paragraph within specified width, handling line wrapping.
-    Returns the updated y_position after drawing the text.
-    """
-    c.setFont(font, font_size)
-    words = text.split()
-    line = ""
-
-    for word in words:
-        # Check if adding the next word would exceed max width
-        if stringWidth(line + word, font, font_size) <= max_width:
-            line += f"{word} "
-        else:
-            # Draw the current line and reset
-            c.drawString(x_position, y_position, line.strip())
-            y_position -= line_height
-            line = f"{word} "
-
-    # Draw the last line if there is any leftover text
-    if line:
-        c.drawString(x_position, y_position, line.strip())
-        y_position -= line_height
-    return y_position
+def startup():
+    """Connect MongoDB and S3 and start this process's job workers; call once before serving"""
+    global db_manager, s3_manager, job_queue
+    with _startup_lock:
+        if job_queue is not None:
+            return
+        db_manager = DatabaseManager()
+        s3_manager = S3Manager()
+        queue = JobQueue(db_manager.db.jobs)
+        queue.ensure_indexes()
+        queue.register('generate_slide', generate_slide_job)
+        queue.register('edit_slide', edit_slide_job)
+        queue.register('cleanup_project', cleanup_project_job)
+        queue.register('compact_thread', compact_thread_job)
+        queue.register('delete_thread', delete_thread_job)
+        job_queue = queue
+        job_queue.start()
+
+@app.before_request
+def ensure_started():
+    # flask run, gunicorn and test clients serve app:app directly
+    if job_queue is None:
+        startup()
 
 if __name__ == '__main__':
     logging.info("Starting Flask app")
+    startup()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
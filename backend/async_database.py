@@ -0,0 +1,190 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from datetime import datetime
+import os
+import copy
+from cachetools import TTLCache
+from dotenv import load_dotenv
+import logging
+from typing import Optional
+from database import TOKEN_CACHE_TTL, TOKEN_CACHE_SIZE, mongo_client_options
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('AsyncDatabaseManager')
+
+load_dotenv()
+
+
+class AsyncDatabaseManager:
+    """Motor port of the DatabaseManager operations used by the async API.
+
+    Indexes and migrations stay with DatabaseManager, which reconciles them at
+    startup. The token cache is per manager; like the cache of other workers,
+    writes made through the sync manager become visible here within
+    TOKEN_CACHE_TTL.
+    """
+
+    def __init__(self):
+        mongo_uri = os.getenv('MONGODB_URI')
+        if not mongo_uri:
+            logger.error("MongoDB URI not found in environment variables")
+            raise ValueError("MongoDB URI not found in environment variables")
+
+        logger.info("Initializing AsyncDatabaseManager")
+        self.client = AsyncIOMotorClient(mongo_uri, **mongo_client_options())
+        self.db = self.client.pitchdeck
+        self.projects = self.db.projects
+        # Only touched from the event loop thread, so no lock is needed
+        self._token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+
+    async def create_project(self, project_id: str, thread_id: str, token: str) -> dict:
+        """Create a new project with token"""
+        project = {
+            'project_id': project_id,
+            'thread_id': thread_id,
+            'token': token,
+            'created_at': datetime.now(),
+            'state': {
+                'current_language': 'en',
+                'slides': {}
+            },
+            'documents': [],
+            'deleted': False
+        }
+        try:
+            # A deleted project with the same ID is revived in place; dropping
+            # deleted_at keeps the TTL index from purging it
+            await self.projects.update_one(
+                {'project_id': project_id},
+                {'$set': project, '$unset': {'deleted_at': ''}},
+                upsert=True
+            )
+            self.invalidate_project_cache(project_id)
+            logger.info(f"Created new project: {project_id}")
+            return project
+        except Exception as e:
+            logger.error(f"Error creating project: {str(e)}")
+            raise
+
+    async def get_project(self, project_id: str) -> Optional[dict]:
+        """Get project with default state structure"""
+        project = await self.projects.find_one(
+            {
+                'project_id': project_id,
+                'deleted': {'$ne': True}
+            },
+            {
+                '_id': 0,
+                'project_id': 1,
+                'thread_id': 1,
+                'token': 1,
+                'state': 1,
+                'documents': 1,
+                'corpus': 1,
+                'deleted': 1
+            }
+        )
+        if project and 'state' not in project:
+            project['state'] = {
+                'current_language': 'en',
+                'slides': {}
+            }
+            await self.projects.update_one(
+                {'project_id': project_id},
+                {'$set': {'state': project['state']}}
+            )
+        return project
+
+    async def get_project_by_token(self, token: str, use_cache: bool = True) -> Optional[dict]:
+        """Retrieve project by token, served from the token cache when fresh"""
+        if use_cache:
+            project = self._token_cache.get(token)
+            if project is not None:
+                return copy.deepcopy(project)
+
+        project = await self.projects.find_one({
+            'token': token,
+            'deleted': False
+        })
+        if project:
+            self._token_cache[token] = copy.deepcopy(project)
+        return project
+
+    def invalidate_project_cache(self, project_id: str) -> None:
+        """Drop cached token lookups for a project after it changes"""
+        stale = [token for token, project in self._token_cache.items()
+                 if project.get('project_id') == project_id]
+        for token in stale:
+            self._token_cache.pop(token, None)
+
+    async def update_project_token(self, project_id: str, token: str) -> bool:
+        """Update or add token to existing project"""
+        logger.info(f"Updating token for project: {project_id}")
+        result = await self.projects.update_one(
+            {'project_id': project_id},
+            {
+                '$set': {
+                    'token': token,
+                    'state': {
+                        'current_language': 'en',
+                        'slides': {}
+                    }
+                }
+            }
+        )
+        self.invalidate_project_cache(project_id)
+        return result.modified_count > 0
+
+    async def update_project_documents(self, project_id: str, documents: list) -> bool:
+        logger.info(f"Updating documents for project {project_id} with {len(documents)} documents")
+        result = await self.projects.update_one(
+            {'project_id': project_id},
+            {'$push': {'documents': {'$each': documents}}, '$unset': {'corpus': ''}}
+        )
+        self.invalidate_project_cache(project_id)
+        return result.modified_count > 0
+
+    async def update_project_language(self, project_id: str, language: str) -> bool:
+        logger.info(f"Updating language for project {project_id} to: {language}")
+        result = await self.projects.update_one(
+            {'project_id': project_id},
+            {'$set': {'state.current_language': language}}
+        )
+        self.invalidate_project_cache(project_id)
+        return result.modified_count > 0
+
+    async def get_slide_content(self, project_id: str, slide_type: str) -> Optional[str]:
+        """Retrieve content for a specific slide"""
+        project = await self.projects.find_one(
+            {'project_id': project_id},
+            {f'state.slides.{slide_type}': 1}
+        )
+        if project and 'state' in project and 'slides' in project['state']:
+            return project['state']['slides'].get(slide_type)
+        return None
+
+    async def update_slide_content(self, project_id: str, slide_type: str, content: str) -> bool:
+        logger.info(f"Updating slide content for project {project_id}, slide: {slide_type}")
+        result = await self.projects.update_one(
+            {'project_id': project_id},
+            {'$set': {f'state.slides.{slide_type}': content}}
+        )
+        self.invalidate_project_cache(project_id)
+        return result.modified_count > 0
+
+    async def delete_project(self, project_id: str) -> bool:
+        """Soft-delete a project; returns False if there was no active project"""
+        logger.info(f"Starting deletion process for project: {project_id}")
+        result = await self.projects.update_one(
+            {'project_id': project_id, 'deleted': {'$ne': True}},
+            {'$set': {'deleted': True, 'deleted_at': datetime.now()}}
+        )
+        self.invalidate_project_cache(project_id)
+        if result.modified_count > 0:
+            logger.info(f"Successfully marked project as deleted: {project_id}")
+            return True
+        logger.warning(f"Project not found for deletion: {project_id}")
+        return False
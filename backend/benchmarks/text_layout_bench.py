@@ -0,0 +1,69 @@
+"""Compare the previous quadratic line wrapping with text_layout on a long deck.
+
+Run from the backend directory: python -m benchmarks.text_layout_bench
+"""
+import random
+import time
+import argparse
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from text_layout import wrap_text
+
+WORDS = ("market revenue founders customers growth platform traction funding "
+         "investors scalable subscription pipeline competition strategy Norwegian "
+         "technology solution problem opportunity milestones").split()
+
+
+def quadratic_wrap(text, max_width, font="Helvetica", font_size=10):
+    """The wrapping loop draw_text_paragraph used before text_layout"""
+    lines = []
+    line = ""
+    for word in text.split():
+        if stringWidth(line + word, font, font_size) <= max_width:
+            line += f"{word} "
+        else:
+            lines.append(line.strip())
+            line = f"{word} "
+    if line:
+        lines.append(line.strip())
+    return lines
+
+
+def make_deck(slides, bullets, words_per_bullet, seed=0):
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(WORDS) for _ in range(words_per_bullet))
+            for _ in range(slides * bullets)]
+
+
+def bench(func, paragraphs, max_width, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for paragraph in paragraphs:
+            func(paragraph, max_width)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--slides', type=int, default=200)
+    parser.add_argument('--bullets', type=int, default=8)
+    parser.add_argument('--words', type=int, default=120)
+    parser.add_argument('--width', type=float, default=455)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    paragraphs = make_deck(args.slides, args.bullets, args.words)
+    assert [quadratic_wrap(p, args.width) for p in paragraphs] == \
+        [wrap_text(p, args.width) for p in paragraphs], "wrapping results differ"
+
+    old = bench(quadratic_wrap, paragraphs, args.width, args.repeat)
+    new = bench(wrap_text, paragraphs, args.width, args.repeat)
+    print(f"{len(paragraphs)} paragraphs, {args.words} words each, width {args.width}")
+    print(f"quadratic wrap:  {old * 1000:8.1f} ms")
+    print(f"text_layout:     {new * 1000:8.1f} ms")
+    print(f"speedup:         {old / new:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
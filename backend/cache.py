@@ -0,0 +1,221 @@
+import os
+import shutil
+import time
+import hashlib
+import tempfile
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('Cache')
+
+
+def _default_sizeof(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return 1
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache bounded by the total size of its values"""
+
+    def __init__(self, max_bytes: int, sizeof: Callable[[Any], int] = _default_sizeof):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries: OrderedDict = OrderedDict()
+        self._sizes = {}
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[Any]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key, value) -> None:
+        size = self.sizeof(value)
+        with self._lock:
+            self._remove(key)
+            # Values larger than the whole cache are not worth evicting everything for
+            if size > self.max_bytes:
+                return
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._total += size
+            while self._total > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def pop_matching(self, predicate: Callable[[Any], bool]) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._total = 0
+
+    def _remove(self, key) -> None:
+        # Called with the lock held
+        if key in self._entries:
+            del self._entries[key]
+            self._total -= self._sizes.pop(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._total,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class DocumentCache:
+    """Two-level cache of extracted document text keyed by S3 key and ETag.
+
+    The memory level holds (etag, text) per S3 key, along with when the ETag
+    was last confirmed against S3; another worker may re-upload a key, so
+    entries older than `revalidate_after` seconds need confirming again. The
+    disk level stores one file per key and ETag, grouped per project so a
+    whole project can be dropped at once, and is shared by every worker on
+    the host.
+    """
+
+    def __init__(self, max_memory_bytes: int, disk_dir: Optional[str], max_disk_bytes: int,
+                 revalidate_after: float = 30):
+        self.memory = LRUCache(max_memory_bytes, sizeof=lambda entry: _default_sizeof(entry[1]))
+        self.revalidate_after = revalidate_after
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._disk_lock = threading.Lock()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def _digest(value: str) -> str:
+        return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+    def _project_dir(self, s3_key: str) -> str:
+        project_id = s3_key.split('/', 1)[0]
+        return os.path.join(self.disk_dir, self._digest(project_id))
+
+    def _key_dir(self, s3_key: str) -> str:
+        return os.path.join(self._project_dir(s3_key), self._digest(s3_key))
+
+    def get(self, s3_key: str) -> Optional[Tuple[str, str]]:
+        """Return (etag, text) from memory if its ETag was confirmed recently"""
+        entry = self.memory.get(s3_key)
+        if entry is None or time.monotonic() - entry[2] > self.revalidate_after:
+            return None
+        return entry[0], entry[1]
+
+    def get_unconfirmed(self, s3_key: str) -> Optional[Tuple[str, str]]:
+        """Return (etag, text) from memory or disk; the caller must validate the ETag"""
+        entry = self.memory.get(s3_key)
+        if entry is not None:
+            return entry[0], entry[1]
+        return self.get_from_disk(s3_key)
+
+    def confirm(self, s3_key: str, etag: str, text: str) -> None:
+        """Keep an entry whose ETag was just checked against S3 in memory"""
+        self.memory.put(s3_key, (etag, text, time.monotonic()))
+
+    def get_from_disk(self, s3_key: str) -> Optional[Tuple[str, str]]:
+        """Return (etag, text) from disk; the caller must validate the ETag"""
+        if not self.disk_dir:
+            return None
+        key_dir = self._key_dir(s3_key)
+        try:
+            names = os.listdir(key_dir)
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if name.startswith('.'):
+                continue
+            path = os.path.join(key_dir, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                # Touch the file so eviction treats it as recently used
+                os.utime(path)
+                return bytes.fromhex(name).decode('utf-8'), text
+            except (OSError, ValueError):
+                continue
+        return None
+
+    def put(self, s3_key: str, etag: str, text: str) -> None:
+        self.confirm(s3_key, etag, text)
+        if not self.disk_dir:
+            return
+        try:
+            key_dir = self._key_dir(s3_key)
+            # Drop entries for older ETags of the same key
+            shutil.rmtree(key_dir, ignore_errors=True)
+            os.makedirs(key_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=key_dir, prefix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, os.path.join(key_dir, etag.encode('utf-8').hex()))
+            self._evict_disk()
+        except OSError as e:
+            logger.warning(f"Failed to write document cache entry for {s3_key}: {str(e)}")
+
+    def invalidate(self, s3_key: str) -> None:
+        self.memory.pop(s3_key)
+        if self.disk_dir:
+            shutil.rmtree(self._key_dir(s3_key), ignore_errors=True)
+
+    def invalidate_project(self, project_id: str) -> None:
+        prefix = f"{project_id}/"
+        self.memory.pop_matching(lambda key: key.startswith(prefix))
+        if self.disk_dir:
+            shutil.rmtree(os.path.join(self.disk_dir, self._digest(project_id)), ignore_errors=True)
+
+    def _evict_disk(self) -> None:
+        with self._disk_lock:
+            files = []
+            total = 0
+            for root, _, names in os.walk(self.disk_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            if total <= self.max_disk_bytes:
+                return
+            for _, size, path in sorted(files):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_disk_bytes:
+                    break
+
+    def stats(self) -> dict:
+        return {'memory': self.memory.stats(), 'disk_dir': self.disk_dir}
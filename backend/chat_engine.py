@@ -0,0 +1,82 @@
+import os
+import logging
+from typing import List, Optional
+from dotenv import load_dotenv
+from openai_client import get_openai_client, get_async_openai_client
+from rate_limiter import get_rate_governor, estimate_tokens, reported_tokens
+from my_prompt import system_prompt
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('ChatEngine')
+
+load_dotenv()
+
+# How slides are generated: 'assistants' runs each prompt on the project's
+# OpenAI thread, 'chat' sends it on its own as a chat completion
+GENERATION_BACKEND = os.getenv('GENERATION_BACKEND', 'assistants')
+CHAT_MODEL = os.getenv('CHAT_MODEL', 'gpt-4o')
+CHAT_MAX_TOKENS = int(os.getenv('CHAT_MAX_TOKENS', '1500'))
+CHAT_TEMPERATURE = float(os.getenv('CHAT_TEMPERATURE', '0.7'))
+
+
+def use_chat_backend() -> bool:
+    return GENERATION_BACKEND == 'chat'
+
+
+def chat_messages(message_content: str, system: Optional[str] = None) -> List[dict]:
+    """A self-contained conversation: the assistant's instructions and one prompt"""
+    return [
+        {'role': 'system', 'content': system or system_prompt},
+        {'role': 'user', 'content': message_content}
+    ]
+
+
+def _estimate(message_content: str, system: Optional[str], max_tokens: int) -> int:
+    return estimate_tokens(system or system_prompt, message_content, completion=max_tokens)
+
+
+def _reply(response) -> Optional[str]:
+    """The reply text, or None if it was cut off by max_tokens and must not be used or cached"""
+    choice = response.choices[0]
+    if choice.finish_reason == 'length':
+        logger.warning("Chat completion truncated by max_tokens, discarding it")
+        return None
+    return choice.message.content
+
+
+def complete_chat(message_content: str, system: Optional[str] = None,
+                  max_tokens: int = CHAT_MAX_TOKENS, json_mode: bool = False) -> Optional[str]:
+    """Generate a reply to the prompt with a single chat completion, by default as the slide assistant.
+
+    With json_mode the reply is a JSON object; the prompt has to ask for one.
+    Returns None if the reply was truncated.
+    """
+    client = get_openai_client()
+    options = {'response_format': {'type': 'json_object'}} if json_mode else {}
+    with get_rate_governor('assistant').admit(_estimate(message_content, system, max_tokens)) as grant:
+        response = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=chat_messages(message_content, system),
+            max_tokens=max_tokens,
+            temperature=CHAT_TEMPERATURE,
+            **options
+        )
+        grant.usage = reported_tokens(response)
+    return _reply(response)
+
+
+async def complete_chat_async(message_content: str) -> Optional[str]:
+    client = get_async_openai_client()
+    async with get_rate_governor('assistant').admit(_estimate(message_content, None, CHAT_MAX_TOKENS)) as grant:
+        response = await client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=chat_messages(message_content),
+            max_tokens=CHAT_MAX_TOKENS,
+            temperature=CHAT_TEMPERATURE
+        )
+        grant.usage = reported_tokens(response)
+    return _reply(response)
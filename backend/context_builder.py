@@ -0,0 +1,180 @@
+import os
+import re
+import threading
+import logging
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from cache import LRUCache
+from corpus import count_tokens, content_hash, get_encoding
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('ContextBuilder')
+
+load_dotenv()
+
+# Maximum corpus tokens inlined into a single slide prompt
+SLIDE_CONTEXT_TOKEN_BUDGET = int(os.getenv('SLIDE_CONTEXT_TOKEN_BUDGET', '6000'))
+CONTEXT_CHUNK_TOKENS = int(os.getenv('CONTEXT_CHUNK_TOKENS', '400'))
+CONTEXT_CACHE_BYTES = int(os.getenv('CONTEXT_CACHE_BYTES', str(128 * 1024 * 1024)))
+
+
+def chunk_corpus(text: str, chunk_tokens: int = CONTEXT_CHUNK_TOKENS) -> List[str]:
+    """Split text into chunks of roughly `chunk_tokens` tokens along paragraph boundaries"""
+    encoding = get_encoding()
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = encoding.encode(paragraph, disallowed_special=())
+
+        # Paragraphs longer than a chunk are cut into token windows
+        if len(tokens) > chunk_tokens:
+            if current:
+                chunks.append('\n\n'.join(current))
+                current, current_tokens = [], 0
+            for start in range(0, len(tokens), chunk_tokens):
+                chunks.append(encoding.decode(tokens[start:start + chunk_tokens]))
+            continue
+
+        if current_tokens + len(tokens) > chunk_tokens and current:
+            chunks.append('\n\n'.join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += len(tokens)
+
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+def slide_query(config: Dict) -> str:
+    """Describe what a slide needs from the documents"""
+    required = ', '.join(element.replace('_', ' ') for element in config.get('required_elements', []))
+    return f"{config['name']}. {config['prompt']} Required elements: {required}"
+
+
+class _ChunkIndex:
+    def __init__(self, chunks: List[str], token_counts: List[int], embeddings: Optional[np.ndarray]):
+        self.chunks = chunks
+        self.token_counts = token_counts
+        self.embeddings = embeddings
+
+    def size(self) -> int:
+        size = sum(len(chunk) for chunk in self.chunks)
+        if self.embeddings is not None:
+            size += self.embeddings.nbytes
+        return size
+
+
+class ContextBuilder:
+    """Selects the corpus chunks most relevant to a slide, up to a token budget.
+
+    Chunk embeddings are computed once per corpus hash and kept in an LRU, so
+    the slides of one deck share a single embedding pass. Without an embedder
+    (or if embedding fails) chunks are ranked by word overlap instead.
+    """
+
+    def __init__(self, embed_texts: Optional[Callable[[List[str]], Optional[List[List[float]]]]] = None,
+                 token_budget: int = SLIDE_CONTEXT_TOKEN_BUDGET,
+                 chunk_tokens: int = CONTEXT_CHUNK_TOKENS):
+        self.embed_texts = embed_texts
+        self.token_budget = token_budget
+        self.chunk_tokens = chunk_tokens
+        self._indexes = LRUCache(CONTEXT_CACHE_BYTES, sizeof=lambda index: index.size())
+        self._queries = LRUCache(8 * 1024 * 1024, sizeof=lambda vector: vector.nbytes)
+        # Per corpus: [lock, callers holding or waiting for it], so building one
+        # deck's index doesn't hold up another's; dropped with its last caller
+        self._locks: Dict[str, list] = {}
+        self._locks_lock = threading.Lock()
+
+    def build(self, corpus_text: str, config: Dict, corpus_hash: Optional[str] = None,
+              token_count: Optional[int] = None) -> str:
+        """Return the context to inline into the prompt for the slide described by `config`.
+
+        Pass the stored corpus's token_count to skip tokenizing the corpus again.
+        """
+        if token_count is None:
+            token_count = count_tokens(corpus_text)
+        if token_count <= self.token_budget:
+            return corpus_text
+
+        index = self._get_index(corpus_hash or content_hash(corpus_text), corpus_text)
+        scores = self._score(index, slide_query(config))
+
+        selected = []
+        used = 0
+        for position in np.argsort(-scores):
+            tokens = index.token_counts[position]
+            if used + tokens > self.token_budget:
+                continue
+            selected.append(position)
+            used += tokens
+
+        logger.info(f"Selected {len(selected)}/{len(index.chunks)} chunks ({used} tokens) for {config['name']}")
+        # Keep the document order so the model reads the excerpts in context
+        return '\n\n'.join(index.chunks[position] for position in sorted(selected))
+
+    def _get_index(self, key: str, corpus_text: str) -> _ChunkIndex:
+        index = self._indexes.get(key)
+        if index is not None:
+            return index
+
+        with self._locks_lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        # Concurrent slides of one deck wait for a single embedding pass
+        try:
+            with entry[0]:
+                index = self._indexes.get(key)
+                if index is not None:
+                    return index
+                chunks = chunk_corpus(corpus_text, self.chunk_tokens)
+                token_counts = [count_tokens(chunk) for chunk in chunks]
+                index = _ChunkIndex(chunks, token_counts, self._embed(chunks))
+                self._indexes.put(key, index)
+                return index
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def _embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        if not self.embed_texts:
+            return None
+        try:
+            vectors = self.embed_texts(texts)
+        except Exception as e:
+            logger.error(f"Embedding failed, using keyword ranking: {str(e)}")
+            return None
+        if not vectors or len(vectors) != len(texts):
+            return None
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def _score(self, index: _ChunkIndex, query: str) -> np.ndarray:
+        if index.embeddings is not None:
+            query_vector = self._queries.get(query)
+            if query_vector is None:
+                embedded = self._embed([query])
+                if embedded is not None:
+                    query_vector = embedded[0]
+                    self._queries.put(query, query_vector)
+            if query_vector is not None:
+                return index.embeddings @ query_vector
+
+        query_words = set(re.findall(r'\w+', query.lower()))
+        return np.array([
+            len(query_words & set(re.findall(r'\w+', chunk.lower()))) / (1 + len(query_words))
+            for chunk in index.chunks
+        ], dtype=np.float32)
@@ -0,0 +1,66 @@
+import os
+import re
+import hashlib
+import functools
+from datetime import datetime
+from typing import Iterable, Dict
+import tiktoken
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Tokenizer used for all token estimates (o200k_base matches the gpt-4o family)
+TOKENIZER_ENCODING = os.getenv('TOKENIZER_ENCODING', 'o200k_base')
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding():
+    return tiktoken.get_encoding(TOKENIZER_ENCODING)
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens in text with the configured tokenizer"""
+    if not text:
+        return 0
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace runs and blank lines left over from PDF/DOCX extraction"""
+    text = text.replace('\x00', '').replace('\r\n', '\n').replace('\r', '\n')
+    text = re.sub(r'[ \t\f\v]+', ' ', text)
+    text = re.sub(r' *\n *', '\n', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def build_corpus(texts: Iterable[str]) -> Dict:
+    """Build the project corpus from document texts.
+
+    Documents are normalized and exact duplicates (after normalization) are
+    dropped, keeping the first occurrence, so re-uploads don't double the corpus.
+    """
+    seen = set()
+    parts = []
+    for text in texts:
+        normalized = normalize_text(text or '')
+        if not normalized:
+            continue
+        digest = content_hash(normalized)
+        if digest in seen:
+            continue
+        seen.add(digest)
+        parts.append(normalized)
+
+    corpus_text = '\n\n'.join(parts)
+    return {
+        'text': corpus_text,
+        'content_hash': content_hash(corpus_text),
+        'token_count': count_tokens(corpus_text),
+        'document_count': len(parts),
+        'built_at': datetime.now().isoformat()
+    }
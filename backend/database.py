@@ -1,9 +1,14 @@
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo import MongoClient, ASCENDING, ReturnDocument
+from pymongo.errors import OperationFailure, DuplicateKeyError
+from datetime import datetime, timedelta
 import os
+import copy
+import importlib.util
+from threading import Lock
+from cachetools import TTLCache
 from dotenv import load_dotenv
 import logging
-from typing import Optional
+from typing import List, Optional
 
 # Configure logging
 logging.basicConfig(
@@ -14,7 +19,55 @@ logger = logging.getLogger('DatabaseManager')
 
 load_dotenv()
 
+# Token -> project cache used by verify_token; keep the TTL short since other
+# workers' writes only become visible here once an entry expires
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', '5'))
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
+
+# Wire compression for MongoDB traffic, in order of preference; codecs whose
+# Python package isn't installed are skipped
+MONGODB_COMPRESSORS = os.getenv('MONGODB_COMPRESSORS', 'zstd,snappy,zlib')
+
+def available_compressors(preferred: str) -> list:
+    modules = {'zstd': 'zstandard', 'snappy': 'snappy', 'zlib': 'zlib'}
+    compressors = []
+    for name in [c.strip() for c in preferred.split(',') if c.strip()]:
+        if name in modules and importlib.util.find_spec(modules[name]) is not None:
+            compressors.append(name)
+    return compressors
+
+def mongo_client_options() -> dict:
+    """Keyword arguments shared by the pymongo and Motor clients"""
+    compressors = available_compressors(MONGODB_COMPRESSORS)
+    # The drivers reject compressors=None, so leave the option out when no codec is usable
+    return {'compressors': compressors} if compressors else {}
+
+# When set, soft-deleted projects are purged by MongoDB this many seconds after deletion
+DELETED_PROJECT_TTL_SECONDS = os.getenv('DELETED_PROJECT_TTL_SECONDS')
+# Generated slides stay in the shared result cache this long after they were last stored
+SLIDE_CACHE_TTL_SECONDS = int(os.getenv('SLIDE_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+
 class DatabaseManager:
+    # Indexes owned by DatabaseManager, reconciled at startup: name -> (keys, options).
+    # Partial filters can't express $ne, so active-project lookups query
+    # deleted == False, which migrate_add_deleted_flag guarantees is set.
+    INDEXES = {
+        'project_id_unique': (
+            [('project_id', ASCENDING)],
+            {'unique': True}
+        ),
+        'token_active_unique': (
+            [('token', ASCENDING)],
+            {'unique': True, 'partialFilterExpression': {'deleted': False}}
+        ),
+        # Only deleted projects are indexed, so a revived one can never expire
+        'deleted_at_ttl': (
+            [('deleted_at', ASCENDING)],
+            {'partialFilterExpression': {'deleted': True},
+             **({'expireAfterSeconds': int(DELETED_PROJECT_TTL_SECONDS)} if DELETED_PROJECT_TTL_SECONDS else {})}
+        ),
+    }
+
     def __init__(self):
         mongo_uri = os.getenv('MONGODB_URI')
         if not mongo_uri:
@@ -22,13 +75,92 @@ class DatabaseManager:
             raise ValueError("MongoDB URI not found in environment variables")
         
         logger.info("Initializing DatabaseManager")
-        self.client = MongoClient(mongo_uri)
+        options = mongo_client_options()
+        logger.info(f"Using MongoDB wire compression: {options.get('compressors') or 'none'}")
+        self.client = MongoClient(mongo_uri, **options)
         self.db = self.client.pitchdeck
         self.projects = self.db.projects
+        self.blobs = self.db.blobs
+        self.slide_cache = self.db.slide_cache
+        self._token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
+        self._token_cache_lock = Lock()
         logger.info("Successfully connected to MongoDB")
         
         # Run migration
         self.migrate_add_deleted_flag()
+        self.ensure_indexes()
+        self.ensure_slide_cache_indexes()
+
+    @staticmethod
+    def _index_options(info: dict) -> dict:
+        return {key: info[key] for key in ('unique', 'partialFilterExpression', 'expireAfterSeconds') if key in info}
+
+    def ensure_indexes(self) -> None:
+        """Create, update or replace the declared indexes on the projects collection"""
+        try:
+            existing = self.projects.index_information()
+        except Exception as e:
+            logger.error(f"Error reading indexes: {str(e)}")
+            return
+
+        for name, (keys, options) in self.INDEXES.items():
+            try:
+                # An index on the same keys under another name blocks creation
+                for other_name, info in list(existing.items()):
+                    if other_name != name and other_name != '_id_' and info['key'] == keys:
+                        logger.info(f"Dropping index {other_name} in favour of {name}")
+                        self.projects.drop_index(other_name)
+                        existing.pop(other_name)
+
+                current = existing.get(name)
+                if current is not None:
+                    current_options = self._index_options(current)
+                    if current['key'] == keys and current_options == options:
+                        continue
+
+                    only_ttl_differs = (
+                        current['key'] == keys
+                        and 'expireAfterSeconds' in options
+                        and {k: v for k, v in current_options.items() if k != 'expireAfterSeconds'}
+                        == {k: v for k, v in options.items() if k != 'expireAfterSeconds'}
+                    )
+                    if only_ttl_differs:
+                        # TTLs can be changed in place without rebuilding the index
+                        self.db.command('collMod', self.projects.name, index={
+                            'keyPattern': dict(keys),
+                            'expireAfterSeconds': options['expireAfterSeconds']
+                        })
+                        logger.info(f"Updated TTL on index {name}")
+                        continue
+
+                    logger.info(f"Rebuilding index {name} with new options")
+                    self.projects.drop_index(name)
+
+                self.projects.create_index(keys, name=name, **options)
+                logger.info(f"Created index {name}")
+            except OperationFailure as e:
+                # e.g. duplicate project_ids in legacy data; keep serving without the index
+                logger.error(f"Error reconciling index {name}: {str(e)}")
+
+    def ensure_slide_cache_indexes(self) -> None:
+        try:
+            self.slide_cache.create_index([('stored_at', ASCENDING)], name='stored_at_ttl',
+                                          expireAfterSeconds=SLIDE_CACHE_TTL_SECONDS)
+        except OperationFailure as e:
+            logger.error(f"Error creating slide cache index: {str(e)}")
+
+    def index_stats(self) -> list:
+        """Report per-index usage counters from $indexStats"""
+        stats = []
+        for entry in self.projects.aggregate([{'$indexStats': {}}]):
+            stats.append({
+                'name': entry['name'],
+                'key': dict(entry['key']),
+                'ops': entry['accesses']['ops'],
+                'since': entry['accesses']['since'].isoformat(),
+                'host': entry.get('host')
+            })
+        return sorted(stats, key=lambda entry: entry['ops'], reverse=True)
 
     def migrate_add_deleted_flag(self):
         """One-time migration to add deleted flag to existing projects"""
@@ -63,12 +195,14 @@ class DatabaseManager:
                 self.projects.update_one(
                     {'project_id': project_id},
                     {
-                        '$set': project
+                        '$set': project,
+                        '$unset': {'deleted_at': ''}
                     }
                 )
             else:
                 # Otherwise create new
                 self.projects.insert_one(project)
+            self.invalidate_project_cache(project_id)
             
             logger.info(f"Created new project: {project_id}")
             return project
@@ -83,6 +217,7 @@ class DatabaseManager:
             {'project_id': project_id},
             {'$push': {'documents': document_metadata}}
         )
+        self.invalidate_project_cache(project_id)
         if result.modified_count > 0:
             logger.info(f"Successfully added document metadata to project: {project_id}")
         else:
@@ -117,6 +252,7 @@ class DatabaseManager:
                     'token': 1,
                     'state': 1,
                     'documents': 1,
+                    'corpus': 1,
                     'deleted': 1
                 }
             )
@@ -143,16 +279,103 @@ class DatabaseManager:
 
     def update_project_documents(self, project_id, documents):
         logger.info(f"Updating documents for project {project_id} with {len(documents)} documents")
+        # The stored corpus no longer covers every document; dropping it in the same
+        # write makes readers fall back to the documents until it is rebuilt
         result = self.projects.update_one(
             {'project_id': project_id},
-            {'$push': {'documents': {'$each': documents}}}
+            {'$push': {'documents': {'$each': documents}}, '$unset': {'corpus': ''}}
         )
+        self.invalidate_project_cache(project_id)
         if result.modified_count > 0:
             logger.info(f"Successfully updated documents for project: {project_id}")
         else:
             logger.warning(f"Failed to update documents for project: {project_id}")
         return result.modified_count > 0
 
+    def update_project_corpus(self, project_id: str, corpus: dict, document_count: Optional[int] = None) -> bool:
+        """Point the project at its current corpus artifact.
+
+        With document_count the pointer is only set while the project still has
+        that many documents, so a corpus built before a later upload is dropped.
+        """
+        logger.info(f"Updating corpus for project {project_id}: {corpus.get('content_hash')}")
+        query = {'project_id': project_id}
+        if document_count is not None:
+            query['documents'] = {'$size': document_count}
+        result = self.projects.update_one(
+            query,
+            {'$set': {'corpus': corpus}}
+        )
+        self.invalidate_project_cache(project_id)
+        if result.modified_count > 0:
+            logger.info(f"Successfully updated corpus for project: {project_id}")
+        else:
+            logger.warning(f"Failed to update corpus for project: {project_id}")
+        return result.modified_count > 0
+
+    def acquire_blob(self, content_hash: str) -> Optional[dict]:
+        """Take a reference on the shared blob for an upload hash, creating it if new.
+
+        Returns the blob after the increment; its status is 'ready' once the
+        extracted text and original are stored. Returns None while a previous
+        blob with this hash is still being deleted, in which case the caller
+        stores the upload under project-scoped keys instead.
+        """
+        try:
+            return self.blobs.find_one_and_update(
+                {'_id': content_hash, 'status': {'$ne': 'deleting'}},
+                {
+                    '$inc': {'refcount': 1},
+                    '$setOnInsert': {'status': 'pending', 'created_at': datetime.now()}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            logger.warning(f"Blob {content_hash} is being deleted, not sharing it")
+            return None
+
+    def mark_blob_ready(self, content_hash: str, keys: dict) -> bool:
+        """Record where a blob's extracted text and original are stored"""
+        result = self.blobs.update_one(
+            {'_id': content_hash, 'status': 'pending'},
+            {'$set': {'status': 'ready', 'keys': keys, 'ready_at': datetime.now()}}
+        )
+        return result.modified_count > 0
+
+    def release_blob(self, content_hash: str, release_id: Optional[str] = None) -> bool:
+        """Drop a reference on a blob; returns True if no references remain.
+
+        The last release moves the blob to 'deleting' so no new upload can
+        acquire it while its objects are removed; call forget_blob afterwards.
+        Releases that may be retried pass a release_id, which makes repeating
+        them a no-op.
+        """
+        query = {'_id': content_hash, 'refcount': {'$gt': 0}}
+        update = {'$inc': {'refcount': -1}}
+        if release_id:
+            query['released_by'] = {'$ne': release_id}
+            update['$addToSet'] = {'released_by': release_id}
+        blob = self.blobs.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+        if blob is None and release_id:
+            # Released by an earlier attempt
+            blob = self.blobs.find_one({'_id': content_hash, 'released_by': release_id})
+        if not blob or blob['refcount'] > 0:
+            return False
+        result = self.blobs.update_one(
+            {'_id': content_hash, 'refcount': 0, 'status': {'$ne': 'deleting'}},
+            {'$set': {'status': 'deleting'}}
+        )
+        if result.modified_count:
+            return True
+        # Either an earlier attempt already moved it to 'deleting', or an upload
+        # re-acquired it after the decrement and its objects must stay
+        return self.blobs.count_documents({'_id': content_hash, 'refcount': 0, 'status': 'deleting'}) > 0
+
+    def forget_blob(self, content_hash: str) -> None:
+        """Remove the record of a blob whose objects have been deleted"""
+        self.blobs.delete_one({'_id': content_hash, 'status': 'deleting', 'refcount': 0})
+
     def update_project_language(self, project_id: str, language: str) -> bool:
         """Update project language and return the updated project"""
         logger.info(f"Updating language for project {project_id} to: {language}")
@@ -165,6 +388,7 @@ class DatabaseManager:
                     }
                 }
             )
+            self.invalidate_project_cache(project_id)
             if result.modified_count > 0:
                 logger.info(f"Successfully updated language for project: {project_id}")
                 return True
@@ -175,31 +399,109 @@ class DatabaseManager:
             logger.error(f"Error updating language: {str(e)}")
             return False
 
+    def apply_translation(self, project_id: str, language: str, source_slides: dict, slides: dict,
+                          variants: dict) -> List[str]:
+        """Switch the project to a translated deck, keeping each language's slides as a variant.
+
+        Each slide is only replaced while it still holds the text it was
+        translated from, so slides generated or edited meanwhile are kept.
+        Returns the names of those slides.
+        """
+        changed = []
+        for name, text in slides.items():
+            if text == source_slides.get(name):
+                continue
+            result = self.projects.update_one(
+                {'project_id': project_id, f'state.slides.{name}': source_slides.get(name)},
+                {'$set': {f'state.slides.{name}': text}}
+            )
+            if not result.matched_count:
+                changed.append(name)
+
+        update = {'state.current_language': language}
+        for variant_language, variant_slides in variants.items():
+            update[f'state.slide_variants.{variant_language}'] = {
+                name: text for name, text in variant_slides.items() if name not in changed
+            }
+        self.projects.update_one({'project_id': project_id}, {'$set': update})
+        self.invalidate_project_cache(project_id)
+        if changed:
+            logger.warning(f"Slides of project {project_id} changed during translation: {changed}")
+        return changed
+
     def update_slide_content(self, project_id, slide_type, content):
         logger.info(f"Updating slide content for project {project_id}, slide: {slide_type}")
         result = self.projects.update_one(
             {'project_id': project_id},
             {'$set': {f'state.slides.{slide_type}': content}}
         )
+        self.invalidate_project_cache(project_id)
         if result.modified_count > 0:
             logger.info(f"Successfully updated slide content for project: {project_id}")
         else:
             logger.warning(f"Failed to update slide content for project: {project_id}")
         return result.modified_count > 0
 
+    def update_thread_tokens(self, project_id: str, thread_id: str, tokens: int) -> bool:
+        """Record the prompt size of the project's thread, unless the thread was swapped meanwhile"""
+        result = self.projects.update_one(
+            {'project_id': project_id, 'thread_id': thread_id},
+            {'$set': {'thread_tokens': tokens}}
+        )
+        return result.matched_count > 0
+
+    def request_thread_compaction(self, project_id: str, thread_id: str, retry_after: float) -> bool:
+        """Claim the compaction of the thread; False if one was requested less than retry_after seconds ago"""
+        now = datetime.now()
+        result = self.projects.update_one(
+            {
+                'project_id': project_id,
+                'thread_id': thread_id,
+                'deleted': {'$ne': True},
+                '$or': [
+                    {'compaction_requested_at': {'$exists': False}},
+                    {'compaction_requested_at': {'$lt': now - timedelta(seconds=retry_after)}}
+                ]
+            },
+            {'$set': {'compaction_requested_at': now}}
+        )
+        return result.modified_count > 0
+
+    def swap_thread(self, project_id: str, old_thread_id: str, new_thread_id: str, tokens: int) -> bool:
+        """Replace the project's thread if it is still old_thread_id"""
+        result = self.projects.update_one(
+            {'project_id': project_id, 'thread_id': old_thread_id, 'deleted': {'$ne': True}},
+            {
+                '$set': {'thread_id': new_thread_id, 'thread_tokens': tokens, 'thread_compacted_at': datetime.now()},
+                '$unset': {'compaction_requested_at': ''}
+            }
+        )
+        self.invalidate_project_cache(project_id)
+        return result.modified_count > 0
+
+    def get_cached_slide(self, cache_key: str) -> Optional[str]:
+        """Content generated earlier for the same slide prompt, if still cached"""
+        entry = self.slide_cache.find_one({'_id': cache_key}, {'content': 1})
+        return entry['content'] if entry else None
+
+    def cache_slide(self, cache_key: str, content: str, slide_type: str, language: str) -> None:
+        self.slide_cache.update_one(
+            {'_id': cache_key},
+            {'$set': {'content': content, 'slide_type': slide_type, 'language': language,
+                      'stored_at': datetime.now()}},
+            upsert=True
+        )
+
     def delete_project(self, project_id: str) -> bool:
-        """Delete project and all associated data"""
+        """Soft-delete a project; returns False if there was no active project.
+
+        Stored documents, vectors and the assistant thread are removed
+        separately by the project cleanup job.
+        """
         logger.info(f"Starting deletion process for project: {project_id}")
         try:
-            # First, get the project to verify it exists
-            project = self.get_project(project_id)
-            if not project:
-                logger.warning(f"Project not found for deletion: {project_id}")
-                return False
-
-            # Mark the project as deleted first
             result = self.projects.update_one(
-                {'project_id': project_id},
+                {'project_id': project_id, 'deleted': {'$ne': True}},
                 {
                     '$set': {
                         'deleted': True,
@@ -207,34 +509,42 @@ class DatabaseManager:
                     }
                 }
             )
-
+            self.invalidate_project_cache(project_id)
             if result.modified_count > 0:
                 logger.info(f"Successfully marked project as deleted: {project_id}")
-                
-                # Clear any cached data
-                if hasattr(self, '_document_cache'):
-                    self._document_cache.pop(project_id, None)
-                if hasattr(self, '_slide_cache'):
-                    self._slide_cache.pop(project_id, None)
-                if hasattr(self, '_html_cache'):
-                    self._html_cache.pop(project_id, None)
-                
                 return True
-            else:
-                logger.error(f"Failed to mark project as deleted: {project_id}")
-                return False
-            
+            logger.warning(f"Project not found for deletion: {project_id}")
+            return False
+
         except Exception as e:
             logger.error(f"Error deleting project: {str(e)}")
-            logger.error(f"Full error details: {e.__class__.__name__}: {str(e)}")
             return False
 
-    def get_project_by_token(self, token: str) -> Optional[dict]:
-        """Retrieve project by token"""
-        return self.projects.find_one({
+    def get_project_by_token(self, token: str, use_cache: bool = True) -> Optional[dict]:
+        """Retrieve project by token, served from the token cache when fresh"""
+        if use_cache:
+            with self._token_cache_lock:
+                project = self._token_cache.get(token)
+            if project is not None:
+                # Callers may mutate the project, so never hand out the cached dict
+                return copy.deepcopy(project)
+
+        project = self.projects.find_one({
             'token': token,
-            'deleted': {'$ne': True}  # Only get non-deleted projects
+            'deleted': False  # Only non-deleted projects; matches the partial token index
         })
+        if project:
+            with self._token_cache_lock:
+                self._token_cache[token] = copy.deepcopy(project)
+        return project
+
+    def invalidate_project_cache(self, project_id: str) -> None:
+        """Drop cached token lookups for a project after it changes"""
+        with self._token_cache_lock:
+            stale = [token for token, project in self._token_cache.items()
+                     if project.get('project_id') == project_id]
+            for token in stale:
+                self._token_cache.pop(token, None)
 
     def get_slide_content(self, project_id: str, slide_type: str) -> Optional[str]:
         """Retrieve content for a specific slide"""
@@ -265,6 +575,8 @@ class DatabaseManager:
                 },
                 upsert=False
             )
+            # The old token must stop resolving immediately
+            self.invalidate_project_cache(project_id)
             
             if result.modified_count > 0:
                 logger.info(f"Successfully updated token for project: {project_id}")
@@ -293,4 +605,17 @@ class DatabaseManager:
             return slides_list
         except Exception as e:
             logging.error(f"Error retrieving slides for project {project_id}: {str(e)}")
-            return None 
\ No newline at end of file
+            return None 
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Manage the projects collection indexes')
+    parser.add_argument('command', choices=['ensure-indexes', 'index-stats'])
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager()  # reconciles indexes on startup
+    if args.command == 'index-stats':
+        for entry in db_manager.index_stats():
+            print(f"{entry['name']:<24} ops={entry['ops']:<10} since={entry['since']} key={entry['key']}")
@@ -0,0 +1,206 @@
+import os
+import math
+import time
+import signal
+import threading
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List
+import PyPDF2
+from docx import Document
+from dotenv import load_dotenv
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('DocumentExtraction')
+
+load_dotenv()
+
+SUPPORTED_EXTENSIONS = {'pdf', 'docx', 'txt'}
+
+# Worker processes for CPU-bound text extraction
+EXTRACTION_PROCESSES = int(os.getenv('EXTRACTION_PROCESSES', str(os.cpu_count() or 2)))
+# PDFs are extracted in page ranges of this size, spread across the workers
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '25'))
+# Wall-clock limit for extracting one document
+EXTRACTION_TIMEOUT_SECONDS = float(os.getenv('EXTRACTION_TIMEOUT_SECONDS', '120'))
+# Address-space limit for each worker process
+EXTRACTION_MEMORY_LIMIT_MB = int(os.getenv('EXTRACTION_MEMORY_LIMIT_MB', '1024'))
+
+
+class UnsupportedDocumentError(Exception):
+    """Raised for file types we can't extract text from"""
+    pass
+
+
+class ExtractionTimeout(Exception):
+    """Raised when a document exceeds its extraction time limit"""
+    pass
+
+
+class ExtractionMemoryError(Exception):
+    """Raised when a document exceeds the extraction worker memory limit"""
+    pass
+
+
+def file_extension(filename: str) -> str:
+    return filename.split('.')[-1].lower()
+
+
+# --- Worker side -------------------------------------------------------------
+
+def _init_worker(memory_limit_bytes: int):
+    if resource is not None and memory_limit_bytes > 0:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, memory_limit_bytes))
+
+
+def _on_alarm(signum, frame):
+    raise ExtractionTimeout("Extraction time limit exceeded")
+
+
+def _run_with_deadline(deadline: float, func, *args):
+    # Tasks run on the worker's main thread, so SIGALRM can interrupt them
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise ExtractionTimeout("Extraction time limit exceeded")
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.alarm(max(1, math.ceil(remaining)))
+    try:
+        return func(*args)
+    except MemoryError:
+        raise ExtractionMemoryError("Extraction memory limit exceeded")
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _count_pages(path: str) -> int:
+    return len(PyPDF2.PdfReader(path).pages)
+
+
+def _page_count(path: str, deadline: float) -> int:
+    return _run_with_deadline(deadline, _count_pages, path)
+
+
+def _extract_pages(path: str, start: int, end: int) -> List[str]:
+    pdf_reader = PyPDF2.PdfReader(path)
+    return [pdf_reader.pages[number].extract_text() or '' for number in range(start, end)]
+
+
+def _extract_page_range(path: str, start: int, end: int, deadline: float) -> List[str]:
+    return _run_with_deadline(deadline, _extract_pages, path, start, end)
+
+
+def _extract_file(path: str, file_ext: str) -> str:
+    if file_ext == 'docx':
+        doc = Document(path)
+        return ' '.join(paragraph.text for paragraph in doc.paragraphs)
+    elif file_ext == 'txt':
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8')
+    raise UnsupportedDocumentError(f"Unsupported file type: {file_ext}")
+
+
+def _extract_whole_file(path: str, file_ext: str, deadline: float) -> str:
+    return _run_with_deadline(deadline, _extract_file, path, file_ext)
+
+
+# --- Parent side -------------------------------------------------------------
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """Return this process's extraction pool, creating it on first use"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn keeps workers free of the parent's sockets and threads
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACTION_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(EXTRACTION_MEMORY_LIMIT_MB * 1024 * 1024,)
+            )
+            _pool_pid = os.getpid()
+            logger.info(f"Started extraction pool with {EXTRACTION_PROCESSES} processes")
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    # A worker died (e.g. killed by the OOM killer); start a fresh pool next time
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _result(pool, future, deadline: float):
+    try:
+        # Workers enforce the deadline themselves; the grace covers scheduling delays
+        return future.result(timeout=max(0.0, deadline - time.time()) + 5)
+    except FutureTimeoutError:
+        raise ExtractionTimeout("Extraction time limit exceeded")
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise ExtractionMemoryError("Extraction worker crashed")
+
+
+def iter_pdf_pages(path: str, timeout: float = EXTRACTION_TIMEOUT_SECONDS,
+                   pages_per_task: int = PDF_PAGES_PER_TASK) -> Iterator[str]:
+    """Yield the text of each page of a PDF, in order.
+
+    Page ranges are extracted across the worker pool with a bounded number
+    in flight, so pages stream out while later ranges are still being read.
+    """
+    deadline = time.time() + timeout
+    pool = get_extraction_pool()
+    # Even parsing the page tree of a hostile PDF happens under the worker limits
+    page_count = _result(pool, pool.submit(_page_count, path, deadline), deadline)
+    ranges = deque((start, min(start + pages_per_task, page_count))
+                   for start in range(0, page_count, pages_per_task))
+
+    in_flight = deque()
+    try:
+        while ranges or in_flight:
+            while ranges and len(in_flight) < EXTRACTION_PROCESSES * 2:
+                start, end = ranges.popleft()
+                in_flight.append(pool.submit(_extract_page_range, path, start, end, deadline))
+            for page_text in _result(pool, in_flight.popleft(), deadline):
+                yield page_text
+    finally:
+        # Timeouts, errors or an abandoned generator cancel the remaining ranges
+        for future in in_flight:
+            future.cancel()
+
+
+def iter_document_text(filename: str, path: str, timeout: float = EXTRACTION_TIMEOUT_SECONDS) -> Iterator[str]:
+    """Yield the extracted text of a document stored at `path` in pieces"""
+    file_ext = file_extension(filename)
+    if file_ext == 'pdf':
+        yield from iter_pdf_pages(path, timeout=timeout)
+    elif file_ext in SUPPORTED_EXTENSIONS:
+        deadline = time.time() + timeout
+        pool = get_extraction_pool()
+        yield _result(pool, pool.submit(_extract_whole_file, path, file_ext, deadline), deadline)
+    else:
+        raise UnsupportedDocumentError(f"Unsupported file type: {file_ext}")
+
+
+def extract_text(filename: str, path: str, timeout: float = EXTRACTION_TIMEOUT_SECONDS) -> str:
+    """Extract the full text of a document stored at `path`"""
+    return ' '.join(iter_document_text(filename, path, timeout=timeout))
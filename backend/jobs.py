@@ -0,0 +1,262 @@
+import os
+import time
+import uuid
+import socket
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+from pymongo import ASCENDING, ReturnDocument
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('JobQueue')
+
+load_dotenv()
+
+# Worker threads per process; 0 only enqueues, leaving the work to other processes
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1.0'))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', '10'))
+# A running job whose heartbeat is older than this is assumed lost and reclaimed
+JOB_STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', '60'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_DELAY = float(os.getenv('JOB_RETRY_DELAY', '5'))
+
+TERMINAL_JOB_STATUSES = {'completed', 'failed'}
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying the job cannot succeed"""
+    pass
+
+
+class JobContext:
+    """What a handler sees of its job: the payload, and progress saved by earlier attempts"""
+
+    def __init__(self, queue: 'JobQueue', job: dict):
+        self._queue = queue
+        self.job_id = job['_id']
+        self.project_id = job.get('project_id')
+        self.payload = job.get('payload', {})
+        self.progress = dict(job.get('progress') or {})
+        self.attempt = job.get('attempts', 1)
+        self._lock = threading.Lock()
+
+    def report(self, **progress):
+        """Persist progress so it is visible to pollers and to a retry after a crash"""
+        # Handlers may report from several threads
+        with self._lock:
+            self.progress.update(progress)
+            self._queue._save_progress(self.job_id, dict(self.progress))
+
+
+class JobQueue:
+    """Durable job queue on a MongoDB collection, worked by local threads.
+
+    Workers claim queued jobs with an atomic find_one_and_update and heartbeat
+    while they run them. A job whose worker stops heartbeating (crash, restart)
+    is claimed again by any process; failed attempts are retried with
+    exponential backoff up to max_attempts.
+    """
+
+    def __init__(self, collection, workers: int = JOB_WORKERS, poll_interval: float = JOB_POLL_INTERVAL,
+                 heartbeat_interval: float = JOB_HEARTBEAT_INTERVAL, stale_after: float = JOB_STALE_AFTER,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, retry_delay: float = JOB_RETRY_DELAY):
+        self.jobs = collection
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._handlers: Dict[str, Callable[[JobContext], Optional[dict]]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._active = set()
+        self._pid = None
+        self.worker_id = None
+
+    def ensure_indexes(self):
+        self.jobs.create_index([('status', ASCENDING), ('run_after', ASCENDING)], name='status_run_after')
+        self.jobs.create_index([('status', ASCENDING), ('heartbeat_at', ASCENDING)], name='status_heartbeat')
+        self.jobs.create_index([('project_id', ASCENDING), ('created_at', ASCENDING)], name='project_created')
+
+    def register(self, job_type: str, handler: Callable[[JobContext], Optional[dict]]):
+        """Handle jobs of `job_type`; the handler's return value is stored as the job result"""
+        self._handlers[job_type] = handler
+
+    def start(self):
+        """Start this process's worker and heartbeat threads (again, after a fork)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._active = set()
+            self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+            if self.workers <= 0:
+                return
+            for number in range(self.workers):
+                threading.Thread(target=self._work, name=f'job-worker-{number}', daemon=True).start()
+            threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True).start()
+        logger.info(f"Started {self.workers} job workers as {self.worker_id}")
+
+    def enqueue(self, job_type: str, payload: dict, project_id: Optional[str] = None,
+                max_attempts: Optional[int] = None, delay: float = 0) -> str:
+        """Queue a job, to be run no sooner than `delay` seconds from now"""
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        now = datetime.now()
+        job_id = uuid.uuid4().hex
+        self.jobs.insert_one({
+            '_id': job_id,
+            'type': job_type,
+            'project_id': project_id,
+            'payload': payload,
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': max_attempts or self.max_attempts,
+            'progress': {},
+            'created_at': now,
+            'updated_at': now,
+            'run_after': now + timedelta(seconds=delay)
+        })
+        logger.info(f"Enqueued {job_type} job {job_id} for project {project_id}")
+        self.start()
+        with self._lock:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.jobs.find_one({'_id': job_id})
+
+    def has_unfinished(self, job_type: str, project_id: str) -> bool:
+        """Whether a job of `job_type` for the project is still queued or running"""
+        return self.jobs.count_documents(
+            {'type': job_type, 'project_id': project_id, 'status': {'$nin': list(TERMINAL_JOB_STATUSES)}},
+            limit=1
+        ) > 0
+
+    @staticmethod
+    def describe(job: dict) -> dict:
+        """The client-facing view of a job"""
+        def iso(value):
+            return value.isoformat() if value else None
+        return {
+            'job_id': job['_id'],
+            'type': job['type'],
+            'status': job['status'],
+            'attempts': job.get('attempts', 0),
+            'progress': job.get('progress', {}),
+            'result': job.get('result'),
+            'error': job.get('error'),
+            'created_at': iso(job.get('created_at')),
+            'updated_at': iso(job.get('updated_at')),
+            'finished_at': iso(job.get('finished_at'))
+        }
+
+    def _claim(self) -> Optional[dict]:
+        now = datetime.now()
+        return self.jobs.find_one_and_update(
+            {
+                '$or': [
+                    {'status': 'queued', 'run_after': {'$lte': now}},
+                    # Running jobs without a recent heartbeat lost their worker
+                    {'status': 'running', 'heartbeat_at': {'$lt': now - timedelta(seconds=self.stale_after)}}
+                ],
+                'type': {'$in': list(self._handlers)}
+            },
+            {
+                '$set': {'status': 'running', 'worker': self.worker_id, 'started_at': now,
+                         'heartbeat_at': now, 'updated_at': now},
+                '$inc': {'attempts': 1}
+            },
+            sort=[('run_after', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _owned(self, job_id: str) -> dict:
+        return {'_id': job_id, 'status': 'running', 'worker': self.worker_id}
+
+    def _save_progress(self, job_id: str, progress: dict):
+        result = self.jobs.update_one(
+            self._owned(job_id),
+            {'$set': {'progress': progress, 'updated_at': datetime.now()}}
+        )
+        if result.matched_count == 0:
+            logger.warning(f"Job {job_id} is no longer owned by this worker")
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                logger.error(f"Error claiming job: {str(e)}")
+                job = None
+            if job is None:
+                with self._lock:
+                    self._wakeup.wait(timeout=self.poll_interval)
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                # e.g. MongoDB unreachable while recording the outcome; the job is
+                # reclaimed once its heartbeat goes stale, and this worker carries on
+                logger.error(f"Error running job {job['_id']}: {str(e)}")
+
+    def _run(self, job: dict):
+        job_id = job['_id']
+        if job['attempts'] > job.get('max_attempts', self.max_attempts):
+            # Reclaimed after its last attempt's worker died
+            self._finish(job_id, 'failed', error='Worker lost on final attempt')
+            return
+
+        logger.info(f"Running {job['type']} job {job_id} (attempt {job['attempts']})")
+        with self._lock:
+            self._active.add(job_id)
+        try:
+            result = self._handlers[job['type']](JobContext(self, job))
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            if not isinstance(e, PermanentJobError) and job['attempts'] < job.get('max_attempts', self.max_attempts):
+                delay = self.retry_delay * 2 ** (job['attempts'] - 1)
+                self.jobs.update_one(
+                    self._owned(job_id),
+                    {'$set': {'status': 'queued', 'error': str(e), 'updated_at': datetime.now(),
+                              'run_after': datetime.now() + timedelta(seconds=delay)}}
+                )
+            else:
+                self._finish(job_id, 'failed', error=str(e))
+        else:
+            self._finish(job_id, 'completed', result=result)
+        finally:
+            with self._lock:
+                self._active.discard(job_id)
+
+    def _finish(self, job_id: str, status: str, result: Optional[dict] = None, error: Optional[str] = None):
+        now = datetime.now()
+        self.jobs.update_one(
+            self._owned(job_id),
+            {'$set': {'status': status, 'result': result, 'error': error,
+                      'finished_at': now, 'updated_at': now}}
+        )
+        logger.info(f"Job {job_id} {status}")
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._lock:
+                active = list(self._active)
+            if not active:
+                continue
+            try:
+                self.jobs.update_many(
+                    {'_id': {'$in': active}, 'status': 'running', 'worker': self.worker_id},
+                    {'$set': {'heartbeat_at': datetime.now()}}
+                )
+            except Exception as e:
+                logger.error(f"Error sending job heartbeat: {str(e)}")
@@ -6,7 +6,8 @@ import pdfkit
 from googleapiclient.http import MediaIoBaseDownload
 from project_state import ProjectState
 from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase.pdfmetrics import stringWidth
+from text_layout import draw_text_paragraph
+from run_waiter import get_run_reply
 from reportlab.pdfgen import canvas
 from io import BytesIO
 
@@ -162,7 +163,7 @@ from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 import io
-from openai import OpenAI
+from openai_client import get_openai_client
 import json
 from messages import (
     PHASE_NAMES_ENGLISH, PHASE_NAMES_NORWEGIAN, PHASE_CONFIGS_ENGLISH, PHASE_CONFIGS_NORWEGIAN,EDITING_MODES, EXPORT_CONFIGS,
@@ -182,8 +183,28 @@ load_dotenv()
 
 
 from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from api import router as api_router
+from app import startup as backend_startup
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(_):
+    # MongoDB, S3 and the job workers start with the server rather than on import
+    await asyncio.to_thread(backend_startup)
+    yield
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True,
+                   allow_methods=["*"], allow_headers=["*"])
+# Async ports of the Flask API routes
+app.include_router(api_router)
+
+# Compatibility mode: routes without an async port are served by the Flask app
+if os.getenv('FLASK_COMPAT', 'true').lower() == 'true':
+    from starlette.middleware.wsgi import WSGIMiddleware
+    from app import app as flask_app
+    app.mount('/', WSGIMiddleware(flask_app))
 
 
 
@@ -288,7 +309,7 @@ class PitchDeckGenerator:
         """Initialize OpenAI client"""
         try:
             if 'client' not in st.session_state:
-                self.user['client'] = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+                self.user['client'] = get_openai_client()
                 self.log_api_call("Initialization", "OpenAI client initialized")
         except Exception as e:
             self.log_api_call("Error", f"OpenAI client initialization failed: {str(e)}", error=True)
@@ -790,33 +811,6 @@ def handle_preview_tab():
         st.error(f"Error generating preview: {str(e)}")
 
 
-# To be used
-def draw_text_paragraph(c, text, y_position, x_position, max_width, font="Helvetica", font_size=10, line_height=14):
-    """
-    Draws a text paragraph within specified width, handling line wrapping.
-    Returns the updated y_position after drawing the text.
-    """
-    c.setFont(font, font_size)
-    words = text.split()
-    line = ""
-
-    for word in words:
-        # Check if adding the next word would exceed max width
-        if stringWidth(line + word, font, font_size) <= max_width:
-            line += f"{word} "
-        else:
-            # Draw the current line and reset
-            c.drawString(x_position, y_position, line.strip())
-            y_position -= line_height
-            line = f"{word} "
-
-    # Draw the last line if there is any leftover text
-    if line:
-        c.drawString(x_position, y_position, line.strip())
-        y_position -= line_height
-
-    return y_position
-
 #To be used
 def generate_pdf_from_text(slides):
     """Generate a PDF document from text content, with each slide on a new page and adjusted formatting."""
@@ -1875,11 +1869,7 @@ Required                ###  Elements:
                     )
 
                 if run.status == "completed":
-                    messages = st.session_state.openai_client.beta.threads.messages.list(
-                        thread_id=st.session_state.thread_id
-                    )
-
-                    response = messages.data[0].content[0].text.value
+                    response = get_run_reply(st.session_state.openai_client, st.session_state.thread_id, run.id)
 
                     cleaned_response = clean_slide_content(response)
 
@@ -0,0 +1,185 @@
+import os
+import asyncio
+import threading
+import logging
+import importlib.util
+from typing import Dict, Optional, Tuple
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('OpenAIClient')
+
+load_dotenv()
+
+# Connection pool settings, shared by every client in the process
+MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '100'))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '20'))
+KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '60'))
+REQUEST_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
+CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))
+MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '2'))
+USE_HTTP2 = os.getenv('OPENAI_HTTP2', 'true').lower() == 'true'
+
+
+class ConnectionMetrics:
+    """Counts requests and newly opened connections to measure keep-alive reuse"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def trace(self, event_name: str, info: dict):
+        # httpcore only emits connect_tcp for connections it has to open,
+        # so requests served from the pool never reach this branch
+        if event_name == 'connection.connect_tcp.complete':
+            self.record_connection()
+
+    async def atrace(self, event_name: str, info: dict):
+        # The async connection pool requires a coroutine trace callback
+        self.trace(event_name, info)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            reused = max(self.requests - self.new_connections, 0)
+            return {
+                'requests': self.requests,
+                'new_connections': self.new_connections,
+                'reused_connections': reused,
+                'reuse_ratio': round(reused / self.requests, 4) if self.requests else 0.0
+            }
+
+
+_lock = threading.Lock()
+_clients: Dict[str, OpenAI] = {}
+_async_clients: Dict[Tuple[str, int], AsyncOpenAI] = {}
+_pid = os.getpid()
+metrics = ConnectionMetrics()
+
+
+def _reset_after_fork():
+    # Sockets inherited from the parent must not be shared with the child
+    global _lock, _clients, _async_clients, _pid, metrics
+    _lock = threading.Lock()
+    _clients = {}
+    _async_clients = {}
+    _pid = os.getpid()
+    metrics = ConnectionMetrics()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _http2_enabled() -> bool:
+    if not USE_HTTP2:
+        return False
+    if importlib.util.find_spec('h2') is None:
+        logger.warning("OPENAI_HTTP2 is enabled but the h2 package is not installed; using HTTP/1.1")
+        return False
+    return True
+
+
+def _on_request(request: httpx.Request):
+    metrics.record_request()
+    request.extensions['trace'] = metrics.trace
+
+
+async def _on_async_request(request: httpx.Request):
+    metrics.record_request()
+    request.extensions['trace'] = metrics.atrace
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+
+def _build_http_client() -> httpx.Client:
+    return DefaultHttpxClient(
+        http2=_http2_enabled(),
+        limits=_pool_limits(),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        event_hooks={'request': [_on_request]}
+    )
+
+
+def _build_async_http_client() -> httpx.AsyncClient:
+    return DefaultAsyncHttpxClient(
+        http2=_http2_enabled(),
+        limits=_pool_limits(),
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        event_hooks={'request': [_on_async_request]}
+    )
+
+
+def get_openai_client(api_key: Optional[str] = None) -> OpenAI:
+    """Return the process-wide OpenAI client for `api_key`, creating it on first use"""
+    api_key = api_key or os.getenv('OPENAI_API_KEY')
+    if _pid != os.getpid():
+        _reset_after_fork()
+
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            logger.info("Creating pooled OpenAI client")
+            client = OpenAI(
+                api_key=api_key,
+                http_client=_build_http_client(),
+                timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+                max_retries=MAX_RETRIES
+            )
+            _clients[api_key] = client
+        return client
+
+
+def get_async_openai_client(api_key: Optional[str] = None) -> AsyncOpenAI:
+    """Return the AsyncOpenAI client for `api_key` on the running event loop.
+
+    Async connections belong to the loop that opened them, so each loop
+    gets its own pooled client.
+    """
+    api_key = api_key or os.getenv('OPENAI_API_KEY')
+    if _pid != os.getpid():
+        _reset_after_fork()
+
+    key = (api_key, id(asyncio.get_running_loop()))
+    with _lock:
+        client = _async_clients.get(key)
+        if client is None:
+            logger.info("Creating pooled AsyncOpenAI client")
+            client = AsyncOpenAI(
+                api_key=api_key,
+                http_client=_build_async_http_client(),
+                timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+                max_retries=MAX_RETRIES
+            )
+            _async_clients[key] = client
+        return client
+
+
+def get_client_metrics() -> dict:
+    """Connection reuse counters for this process"""
+    return {
+        'pid': os.getpid(),
+        'clients': len(_clients),
+        'async_clients': len(_async_clients),
+        **metrics.snapshot()
+    }
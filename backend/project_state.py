@@ -4,6 +4,8 @@ import json
 from datetime import datetime
 from typing import Optional, Dict
 from vector_store import VectorStore
+from run_waiter import get_run_reply
+from rate_limiter import get_rate_governor, estimate_tokens, reported_tokens, RATE_LIMIT_COMPLETION_ESTIMATE
 
 class ProjectState:
     def __init__(self, project_id: str, vector_store: VectorStore, user, client):
@@ -197,32 +199,33 @@ class ProjectState:
 
     Please maintain the same format and structure, but incorporate the requested changes."""
 
-            # Send message to OpenAI
-            message = self.client.beta.threads.messages.create(
-                thread_id= self.user['thread_id'],
-                role="user",
-                content=message_content
-            )
-
-            run = self.client.beta.threads.runs.create(
-                thread_id=self.user['thread_id'],
-                assistant_id="asst_uCXB3ZuddxaZZeEqPh8LZ5Zf"
-            )
-
-            # Wait for completion with status updates
-            # with st.spinner("Updating slide..."):
-            while run.status in ["queued", "in_progress"]:
-                time.sleep(1)
-                run = self.client.beta.threads.runs.retrieve(
-                    thread_id=self.user,
-                    run_id=run.id
+            # Admitted through the shared rate limits and settled with the run's usage
+            estimate = estimate_tokens(message_content, completion=RATE_LIMIT_COMPLETION_ESTIMATE)
+            with get_rate_governor('assistant').admit(estimate) as grant:
+                # Send message to OpenAI
+                message = self.client.beta.threads.messages.create(
+                    thread_id= self.user['thread_id'],
+                    role="user",
+                    content=message_content
                 )
 
-            if run.status == "completed":
-                messages = self.client.beta.threads.messages.list(
-                    thread_id=self.user['thread_id']
+                run = self.client.beta.threads.runs.create(
+                    thread_id=self.user['thread_id'],
+                    assistant_id="asst_uCXB3ZuddxaZZeEqPh8LZ5Zf"
                 )
-                response = messages.data[0].content[0].text.value
+
+                # Wait for completion with status updates
+                # with st.spinner("Updating slide..."):
+                while run.status in ["queued", "in_progress"]:
+                    time.sleep(1)
+                    run = self.client.beta.threads.runs.retrieve(
+                        thread_id=self.user['thread_id'],
+                        run_id=run.id
+                    )
+                grant.usage = reported_tokens(run)
+
+            if run.status == "completed":
+                response = get_run_reply(self.client, self.user['thread_id'], run.id)
 
                 # Update both raw response and parsed content
                 # st.session_state.raw_responses[slide_type] = response
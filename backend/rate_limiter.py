@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import asyncio
+import threading
+import logging
+from typing import Callable, Dict, Optional, Tuple
+from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
+from dotenv import load_dotenv
+from corpus import count_tokens
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('RateGovernor')
+
+load_dotenv()
+
+# Where the shared bucket levels live: 'mongo' (all hosts), 'file' (processes of one host), or 'auto'
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'auto')
+RATE_LIMIT_FILE = os.getenv('RATE_LIMIT_FILE', '/tmp/pitchdeck-rate-limits.json')
+# Fraction of the OpenAI limits we admit, so bursts stay just under them
+RATE_LIMIT_HEADROOM = float(os.getenv('RATE_LIMIT_HEADROOM', '0.9'))
+# Longest a call waits for admission before RateLimitTimeout
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', '120'))
+# Completion tokens charged up front for an assistant run, until its usage is known
+RATE_LIMIT_COMPLETION_ESTIMATE = int(os.getenv('RATE_LIMIT_COMPLETION_ESTIMATE', '1000'))
+
+# Per-minute limits of the organisation, per bucket
+RATE_LIMITS = {
+    'assistant': (int(os.getenv('OPENAI_RPM', '500')), int(os.getenv('OPENAI_TPM', '30000'))),
+    'embeddings': (int(os.getenv('OPENAI_EMBEDDING_RPM', '3000')), int(os.getenv('OPENAI_EMBEDDING_TPM', '1000000')))
+}
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a call is not admitted within the allowed wait"""
+    pass
+
+
+class Grant:
+    """An admitted call; set `usage` to the actual token count to settle the estimate"""
+
+    def __init__(self, governor: 'RateGovernor', tokens: int):
+        self.governor = governor
+        self.tokens = tokens
+        self.usage: Optional[int] = None
+        self.waited = 0.0
+        self.charged = False
+
+
+class MongoBucketStore:
+    """Bucket levels in a MongoDB document, updated by compare-and-swap on a version"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def transact(self, name: str, update: Callable[[dict], Optional[dict]]):
+        """Apply update(state) atomically; update returns the new state, or None to leave it"""
+        while True:
+            doc = self.collection.find_one({'_id': name}) or {'_id': name, 'version': 0}
+            state = update({key: value for key, value in doc.items() if key not in ('_id', 'version')})
+            if state is None:
+                return False
+            if doc['version'] == 0:
+                try:
+                    self.collection.insert_one({'_id': name, 'version': 1, **state})
+                    return True
+                except DuplicateKeyError:
+                    # Another process created it first
+                    continue
+            result = self.collection.update_one(
+                {'_id': name, 'version': doc['version']},
+                {'$set': state, '$inc': {'version': 1}}
+            )
+            if result.modified_count:
+                return True
+
+
+class FileBucketStore:
+    """Bucket levels in a JSON file, serialized between processes with flock"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def transact(self, name: str, update: Callable[[dict], Optional[dict]]):
+        with self._lock, open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                buckets = json.loads(raw) if raw else {}
+                state = update(buckets.get(name, {}))
+                if state is None:
+                    return False
+                buckets[name] = state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(buckets))
+                f.flush()
+                return True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RateGovernor:
+    """Token-bucket admission for OpenAI calls, shared by all worker processes.
+
+    Two buckets refill continuously, one with requests and one with tokens,
+    at `headroom` times the per-minute limits. A call is charged one request
+    and its estimated tokens before it is sent; when the response reports
+    its usage, the difference is settled so the next callers wait for what
+    was really spent. If the shared state is unreachable calls are admitted
+    unthrottled rather than failing.
+    """
+
+    def __init__(self, name: str, store, requests_per_minute: int, tokens_per_minute: int,
+                 headroom: float = RATE_LIMIT_HEADROOM, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.name = name
+        self.store = store
+        self.request_capacity = max(requests_per_minute * headroom, 1.0)
+        self.token_capacity = max(tokens_per_minute * headroom, 1.0)
+        self.max_wait = max_wait
+
+    def _refill(self, state: dict, now: float) -> Tuple[float, float]:
+        elapsed = max(now - state.get('updated_at', now), 0.0)
+        requests = min(state.get('requests', self.request_capacity) + elapsed * self.request_capacity / 60,
+                       self.request_capacity)
+        tokens = min(state.get('tokens', self.token_capacity) + elapsed * self.token_capacity / 60,
+                     self.token_capacity)
+        return requests, tokens
+
+    def try_acquire(self, tokens: int) -> float:
+        """Charge the call if the buckets allow it; returns 0, or the seconds to wait before trying again"""
+        # A call larger than the bucket is admitted once the bucket is full, leaving it in debt
+        needed = min(tokens, self.token_capacity)
+        wait = 0.0
+
+        def update(state):
+            nonlocal wait
+            now = time.time()
+            requests, available = self._refill(state, now)
+            if requests >= 1 and available >= needed:
+                wait = 0.0
+                return {'requests': requests - 1, 'tokens': available - tokens, 'updated_at': now}
+            wait = max((1 - requests) * 60 / self.request_capacity,
+                       (needed - available) * 60 / self.token_capacity, 0.05)
+            return None
+
+        self.store.transact(self.name, update)
+        return wait
+
+    def settle(self, grant: Grant):
+        """Correct the up-front charge by the usage reported for the call"""
+        if not grant.charged or grant.usage is None or grant.usage == grant.tokens:
+            return
+        difference = grant.usage - grant.tokens
+
+        def update(state):
+            now = time.time()
+            requests, available = self._refill(state, now)
+            return {'requests': requests, 'tokens': min(available - difference, self.token_capacity),
+                    'updated_at': now}
+
+        try:
+            self.store.transact(self.name, update)
+        except Exception as e:
+            logger.error(f"Error settling {self.name} usage: {str(e)}")
+
+    def acquire(self, tokens: int) -> Grant:
+        grant = Grant(self, tokens)
+        started = time.monotonic()
+        while True:
+            try:
+                wait = self.try_acquire(tokens)
+            except Exception as e:
+                logger.error(f"Rate limit state unavailable, admitting {self.name} call: {str(e)}")
+                return grant
+            if not wait:
+                grant.charged = True
+                break
+            grant.waited = time.monotonic() - started
+            if grant.waited + wait > self.max_wait:
+                raise RateLimitTimeout(f"{self.name} call of {tokens} tokens not admitted within {self.max_wait}s")
+            time.sleep(wait)
+        grant.waited = time.monotonic() - started
+        if grant.waited > 1:
+            logger.info(f"{self.name} call of {tokens} tokens admitted after {grant.waited:.1f}s")
+        return grant
+
+    async def acquire_async(self, tokens: int) -> Grant:
+        grant = Grant(self, tokens)
+        started = time.monotonic()
+        while True:
+            try:
+                wait = await asyncio.to_thread(self.try_acquire, tokens)
+            except Exception as e:
+                logger.error(f"Rate limit state unavailable, admitting {self.name} call: {str(e)}")
+                return grant
+            if not wait:
+                grant.charged = True
+                break
+            grant.waited = time.monotonic() - started
+            if grant.waited + wait > self.max_wait:
+                raise RateLimitTimeout(f"{self.name} call of {tokens} tokens not admitted within {self.max_wait}s")
+            await asyncio.sleep(wait)
+        grant.waited = time.monotonic() - started
+        return grant
+
+    def admit(self, tokens: int) -> '_Admission':
+        """Context manager: waits for admission on entry and settles `grant.usage` on exit"""
+        return _Admission(self, tokens)
+
+
+class _Admission:
+    def __init__(self, governor: RateGovernor, tokens: int):
+        self.governor = governor
+        self.tokens = tokens
+        self.grant: Optional[Grant] = None
+
+    def __enter__(self) -> Grant:
+        self.grant = self.governor.acquire(self.tokens)
+        return self.grant
+
+    def __exit__(self, *exc):
+        self.governor.settle(self.grant)
+        return False
+
+    async def __aenter__(self) -> Grant:
+        self.grant = await self.governor.acquire_async(self.tokens)
+        return self.grant
+
+    async def __aexit__(self, *exc):
+        await asyncio.to_thread(self.governor.settle, self.grant)
+        return False
+
+
+def estimate_tokens(*texts: str, completion: int = 0) -> int:
+    """Tokens a call is charged before its usage is known"""
+    return sum(count_tokens(text) for text in texts if text) + completion
+
+
+def reported_tokens(response) -> Optional[int]:
+    """Total tokens from the `usage` of a response or run, if it reports one"""
+    usage = getattr(response, 'usage', None)
+    return getattr(usage, 'total_tokens', None) if usage else None
+
+
+_lock = threading.Lock()
+_store = None
+_governors: Dict[str, RateGovernor] = {}
+
+
+def _create_store():
+    backend = RATE_LIMIT_BACKEND
+    if backend == 'auto':
+        backend = 'mongo' if os.getenv('MONGODB_URI') else 'file'
+    if backend == 'mongo':
+        return MongoBucketStore(MongoClient(os.getenv('MONGODB_URI')).pitchdeck.rate_limits)
+    if fcntl is None:
+        raise RuntimeError("File-backed rate limits need fcntl; set RATE_LIMIT_BACKEND=mongo")
+    return FileBucketStore(RATE_LIMIT_FILE)
+
+
+def get_rate_governor(name: str) -> RateGovernor:
+    """The process-wide governor for one of the RATE_LIMITS buckets"""
+    global _store
+    governor = _governors.get(name)
+    if governor is None:
+        with _lock:
+            governor = _governors.get(name)
+            if governor is None:
+                if _store is None:
+                    _store = _create_store()
+                requests_per_minute, tokens_per_minute = RATE_LIMITS[name]
+                governor = _governors[name] = RateGovernor(name, _store, requests_per_minute, tokens_per_minute)
+    return governor
@@ -0,0 +1,204 @@
+import os
+import time
+import asyncio
+import threading
+import logging
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Optional
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('RunScheduler')
+
+load_dotenv()
+
+# Threads shared by all queued synchronous runs; one thread runs at most one task at a time
+RUN_SCHEDULER_WORKERS = int(os.getenv('RUN_SCHEDULER_WORKERS', '32'))
+# Idle projects whose statistics are kept
+RUN_SCHEDULER_STATS_SIZE = int(os.getenv('RUN_SCHEDULER_STATS_SIZE', '10000'))
+
+
+class _Task:
+    __slots__ = ('key', 'dispatch', 'enqueued_at')
+
+    def __init__(self, key: str, dispatch: Callable[[], None]):
+        self.key = key
+        self.dispatch = dispatch
+        self.enqueued_at = time.monotonic()
+
+
+class _QueueStats:
+    def __init__(self):
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def snapshot(self) -> dict:
+        started = self.completed + self.active
+        return {
+            'depth': self.waiting + self.active,
+            'waiting': self.waiting,
+            'active': self.active,
+            'completed': self.completed,
+            'avg_wait_seconds': round(self.total_wait / started, 3) if started else 0.0,
+            'max_wait_seconds': round(self.max_wait, 3),
+            'last_wait_seconds': round(self.last_wait, 3)
+        }
+
+
+class RunScheduler:
+    """Runs work on OpenAI threads one task at a time per thread, in FIFO order.
+
+    A thread rejects new runs while one is active, so tasks for the same
+    thread_id wait their turn instead of failing. Tasks for different threads
+    run concurrently: synchronous ones on a shared executor, coroutines on
+    their own event loop. Queue depth and wait times are tracked per project.
+    """
+
+    def __init__(self, max_workers: int = RUN_SCHEDULER_WORKERS, stats_size: int = RUN_SCHEDULER_STATS_SIZE):
+        self.max_workers = max_workers
+        self.stats_size = stats_size
+        self._queues: Dict[str, Deque[_Task]] = {}
+        self._stats: 'OrderedDict[str, _QueueStats]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pid = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Called with the lock held; forked workers need their own threads
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='run-scheduler')
+            self._pid = os.getpid()
+        return self._executor
+
+    def _project_stats(self, key: str) -> _QueueStats:
+        # Called with the lock held
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = _QueueStats()
+        self._stats.move_to_end(key)
+        while len(self._stats) > self.stats_size:
+            oldest, oldest_stats = next(iter(self._stats.items()))
+            if oldest_stats.waiting or oldest_stats.active:
+                break
+            self._stats.popitem(last=False)
+        return stats
+
+    def _enqueue(self, thread_id: str, task: _Task):
+        with self._lock:
+            queue = self._queues.setdefault(thread_id, deque())
+            queue.append(task)
+            self._project_stats(task.key).waiting += 1
+            first = len(queue) == 1
+        if first:
+            self._start(task)
+
+    def _start(self, task: _Task):
+        wait = time.monotonic() - task.enqueued_at
+        with self._lock:
+            stats = self._project_stats(task.key)
+            stats.waiting -= 1
+            stats.active += 1
+            stats.total_wait += wait
+            stats.max_wait = max(stats.max_wait, wait)
+            stats.last_wait = wait
+        if wait > 1:
+            logger.info(f"Run for {task.key} started after waiting {wait:.1f}s")
+        task.dispatch()
+
+    def _release(self, thread_id: str):
+        with self._lock:
+            queue = self._queues[thread_id]
+            finished = queue.popleft()
+            stats = self._project_stats(finished.key)
+            stats.active -= 1
+            stats.completed += 1
+            if queue:
+                following = queue[0]
+            else:
+                del self._queues[thread_id]
+                following = None
+        if following:
+            self._start(following)
+
+    def submit(self, thread_id: str, fn: Callable, *args, project_id: Optional[str] = None, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs) behind earlier tasks for thread_id; returns its future"""
+        future: Future = Future()
+
+        def execute():
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                self._release(thread_id)
+
+        def dispatch():
+            with self._lock:
+                executor = self._get_executor()
+            executor.submit(execute)
+
+        self._enqueue(thread_id, _Task(project_id or thread_id, dispatch))
+        return future
+
+    def run(self, thread_id: str, fn: Callable, *args, project_id: Optional[str] = None, **kwargs):
+        """Run fn in thread_id's queue and wait for its result"""
+        return self.submit(thread_id, fn, *args, project_id=project_id, **kwargs).result()
+
+    async def run_async(self, thread_id: str, fn: Callable, *args, project_id: Optional[str] = None, **kwargs):
+        """Await coroutine function fn in thread_id's queue, on the caller's event loop"""
+        loop = asyncio.get_running_loop()
+        turn = loop.create_future()
+
+        def grant():
+            if turn.cancelled():
+                # The caller gave up while queued
+                self._release(thread_id)
+            else:
+                turn.set_result(None)
+
+        self._enqueue(thread_id, _Task(project_id or thread_id, lambda: loop.call_soon_threadsafe(grant)))
+        try:
+            await turn
+        except asyncio.CancelledError:
+            if turn.done() and not turn.cancelled():
+                # Cancelled just after being granted the turn
+                self._release(thread_id)
+            raise
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            self._release(thread_id)
+
+    def stats(self, project_id: Optional[str] = None) -> dict:
+        """Queue depth and wait times for one project, or totals across all of them"""
+        with self._lock:
+            if project_id is not None:
+                stats = self._stats.get(project_id)
+                return (stats or _QueueStats()).snapshot()
+            total = _QueueStats()
+            for stats in self._stats.values():
+                total.waiting += stats.waiting
+                total.active += stats.active
+                total.completed += stats.completed
+                total.total_wait += stats.total_wait
+                total.max_wait = max(total.max_wait, stats.max_wait)
+            return {
+                'pid': os.getpid(),
+                'threads': len(self._queues),
+                'projects': len(self._stats),
+                **total.snapshot()
+            }
+
+
+run_scheduler = RunScheduler()
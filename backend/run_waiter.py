@@ -0,0 +1,237 @@
+import os
+import asyncio
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('RunWaiter')
+
+load_dotenv()
+
+# Run states after which the run will not make progress on its own
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete", "requires_action"}
+
+
+class RunWaitError(Exception):
+    """Raised when a run cannot be waited on (timeout or shutdown)"""
+    pass
+
+
+class _PendingRun:
+    def __init__(self, client, thread_id: str, run, deadline: float, initial_interval: float):
+        self.client = client
+        self.thread_id = thread_id
+        self.run = run
+        self.deadline = deadline
+        self.interval = initial_interval
+        self.next_poll = time.monotonic() + initial_interval
+        self.polls = 0
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+
+class RunWaiter:
+    """Waits on many OpenAI Assistants runs from a single background polling loop.
+
+    Callers block on an event instead of polling themselves. The loop polls each
+    run on its own schedule, backing off from `min_interval` to `max_interval`
+    the longer the run stays queued or in progress.
+    """
+
+    def __init__(self, min_interval: float = 0.25, max_interval: float = 2.0,
+                 backoff: float = 1.5, default_timeout: float = 300.0, poll_concurrency: int = 8):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.default_timeout = default_timeout
+        self.poll_concurrency = poll_concurrency
+        self._pending: Dict[str, _PendingRun] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _ensure_loop(self):
+        # Called with the lock held; restarts the loop in forked workers too
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._executor = ThreadPoolExecutor(max_workers=self.poll_concurrency,
+                                                thread_name_prefix='run-poll')
+            self._thread = threading.Thread(target=self._loop, name='run-waiter', daemon=True)
+            self._thread.start()
+
+    def wait(self, client, thread_id: str, run, timeout: Optional[float] = None):
+        """Block until `run` reaches a terminal state and return the final run object.
+
+        Runs stuck in `requires_action` are cancelled, since none of our assistants
+        define tools and the thread would otherwise stay locked. Raises RunWaitError
+        if the run does not finish within `timeout` seconds.
+        """
+        if run.status in TERMINAL_STATUSES:
+            return self._finalize(client, thread_id, run)
+
+        timeout = self.default_timeout if timeout is None else timeout
+        pending = _PendingRun(client, thread_id, run, time.monotonic() + timeout, self.min_interval)
+        with self._lock:
+            self._pending[run.id] = pending
+            self._ensure_loop()
+            self._wakeup.notify()
+
+        pending.done.wait()
+        if pending.error:
+            raise pending.error
+        return self._finalize(client, thread_id, pending.run)
+
+    async def wait_async(self, client, thread_id: str, run, timeout: Optional[float] = None):
+        """Coroutine counterpart of wait() for AsyncOpenAI clients.
+
+        Each waiting run is a suspended coroutine rather than a blocked thread,
+        polled on the same backoff schedule.
+        """
+        timeout = self.default_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        interval = self.min_interval
+        polls = 0
+
+        while run.status not in TERMINAL_STATUSES:
+            if time.monotonic() >= deadline:
+                logger.error(f"Timed out waiting for run {run.id} (status: {run.status})")
+                await self._cancel_async(client, thread_id, run.id)
+                raise RunWaitError(f"Timed out waiting for run {run.id}")
+            await asyncio.sleep(interval)
+            interval = min(interval * self.backoff, self.max_interval)
+            try:
+                run = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+            except Exception as e:
+                # Transient API errors are retried until the deadline
+                logger.warning(f"Error polling run {run.id}: {str(e)}")
+            polls += 1
+
+        if polls:
+            logger.info(f"Run {run.id} resolved with status {run.status} after {polls} polls")
+        if run.status == "requires_action":
+            logger.warning(f"Run {run.id} requires action; cancelling it")
+            await self._cancel_async(client, thread_id, run.id)
+        elif run.status != "completed":
+            error = getattr(run, 'last_error', None)
+            logger.error(f"Run {run.id} finished with status {run.status}: {error}")
+        return run
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def _finalize(self, client, thread_id: str, run):
+        if run.status == "requires_action":
+            logger.warning(f"Run {run.id} requires action; cancelling it")
+            self._cancel(client, thread_id, run.id)
+        elif run.status != "completed":
+            error = getattr(run, 'last_error', None)
+            logger.error(f"Run {run.id} finished with status {run.status}: {error}")
+        return run
+
+    def _cancel(self, client, thread_id: str, run_id: str):
+        try:
+            client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        except Exception as e:
+            logger.error(f"Failed to cancel run {run_id}: {str(e)}")
+
+    async def _cancel_async(self, client, thread_id: str, run_id: str):
+        try:
+            await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+        except Exception as e:
+            logger.error(f"Failed to cancel run {run_id}: {str(e)}")
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._wakeup.wait()
+                now = time.monotonic()
+                due = [p for p in self._pending.values() if p.next_poll <= now]
+                if not due:
+                    next_poll = min(p.next_poll for p in self._pending.values())
+                    self._wakeup.wait(timeout=max(0.0, next_poll - now))
+                    continue
+
+            # Retrieve due runs concurrently so one slow poll doesn't delay the rest
+            list(self._executor.map(self._poll, due))
+
+    def _poll(self, pending: _PendingRun):
+        run = pending.run
+        try:
+            run = pending.client.beta.threads.runs.retrieve(
+                thread_id=pending.thread_id,
+                run_id=run.id
+            )
+            pending.run = run
+        except Exception as e:
+            # Transient API errors are retried until the deadline
+            logger.warning(f"Error polling run {run.id}: {str(e)}")
+
+        pending.polls += 1
+        now = time.monotonic()
+        if run.status in TERMINAL_STATUSES:
+            self._resolve(pending)
+        elif now >= pending.deadline:
+            logger.error(f"Timed out waiting for run {run.id} (status: {run.status})")
+            self._cancel(pending.client, pending.thread_id, run.id)
+            pending.error = RunWaitError(f"Timed out waiting for run {run.id}")
+            self._resolve(pending)
+        else:
+            pending.interval = min(pending.interval * self.backoff, self.max_interval)
+            pending.next_poll = now + pending.interval
+
+    def _resolve(self, pending: _PendingRun):
+        with self._lock:
+            self._pending.pop(pending.run.id, None)
+        logger.info(f"Run {pending.run.id} resolved with status {pending.run.status} after {pending.polls} polls")
+        pending.done.set()
+
+
+run_waiter = RunWaiter(
+    min_interval=float(os.getenv('RUN_POLL_MIN_INTERVAL', '0.25')),
+    max_interval=float(os.getenv('RUN_POLL_MAX_INTERVAL', '2.0')),
+    default_timeout=float(os.getenv('RUN_WAIT_TIMEOUT', '300')),
+    poll_concurrency=int(os.getenv('RUN_POLL_CONCURRENCY', '8'))
+)
+
+
+def wait_for_run(client, thread_id: str, run, timeout: Optional[float] = None):
+    """Wait on the process-wide RunWaiter"""
+    return run_waiter.wait(client, thread_id, run, timeout=timeout)
+
+
+def _reply_text(messages) -> Optional[str]:
+    if not messages.data:
+        return None
+    return next((part.text.value for part in messages.data[0].content if part.type == 'text'), None)
+
+
+def get_run_reply(client, thread_id: str, run_id: str) -> Optional[str]:
+    """Text of the latest message written by the run, or None if it wrote none.
+
+    Filtering on run_id keeps the page to one message however long the thread
+    is, and ignores replies of other runs that finished in the meantime.
+    """
+    messages = client.beta.threads.messages.list(thread_id=thread_id, run_id=run_id, order='desc', limit=1)
+    return _reply_text(messages)
+
+
+async def get_run_reply_async(client, thread_id: str, run_id: str) -> Optional[str]:
+    messages = await client.beta.threads.messages.list(thread_id=thread_id, run_id=run_id, order='desc', limit=1)
+    return _reply_text(messages)
+
+
+async def wait_for_run_async(client, thread_id: str, run, timeout: Optional[float] = None):
+    """Await a run with an AsyncOpenAI client, using the process-wide backoff settings"""
+    return await run_waiter.wait_async(client, thread_id, run, timeout=timeout)
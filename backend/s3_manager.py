@@ -1,8 +1,20 @@
 import boto3
+import io
 import os
+import gzip
+import zlib
+import tempfile
+from boto3.s3.transfer import TransferConfig
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from botocore.exceptions import ClientError
 import logging
+from cache import DocumentCache
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Configure logging
 logging.basicConfig(
@@ -13,10 +25,138 @@ logger = logging.getLogger('S3Manager')
 
 load_dotenv()
 
+# Extracted-text cache in front of get_document; set DOCUMENT_CACHE_DIR to '' to disable the disk level
+DOCUMENT_CACHE_MEMORY_BYTES = int(os.getenv('DOCUMENT_CACHE_MEMORY_BYTES', str(256 * 1024 * 1024)))
+DOCUMENT_CACHE_DISK_BYTES = int(os.getenv('DOCUMENT_CACHE_DISK_BYTES', str(2 * 1024 * 1024 * 1024)))
+DOCUMENT_CACHE_DIR = os.getenv('DOCUMENT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'pitchdeck-document-cache'))
+# Memory hits older than this are confirmed with a HEAD request, in case another worker re-uploaded the key
+DOCUMENT_CACHE_REVALIDATE_SECONDS = float(os.getenv('DOCUMENT_CACHE_REVALIDATE_SECONDS', '30'))
+
+# Managed multipart transfer settings for streaming uploads
+S3_MULTIPART_THRESHOLD = int(os.getenv('S3_MULTIPART_THRESHOLD', str(8 * 1024 * 1024)))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv('S3_MULTIPART_CHUNKSIZE', str(8 * 1024 * 1024)))
+S3_MAX_CONCURRENCY = int(os.getenv('S3_MAX_CONCURRENCY', '4'))
+# Concurrent DeleteObjects batches (of up to 1000 keys) when deleting a project
+S3_DELETE_CONCURRENCY = int(os.getenv('S3_DELETE_CONCURRENCY', '8'))
+
+# Compression for extracted text at rest: 'zstd', 'gzip' or 'none'
+S3_TEXT_COMPRESSION = os.getenv('S3_TEXT_COMPRESSION', 'zstd' if zstandard else 'gzip').lower()
+if S3_TEXT_COMPRESSION == 'zstd' and zstandard is None:
+    logger.warning("zstandard is not installed; compressing extracted text with gzip")
+    S3_TEXT_COMPRESSION = 'gzip'
+
+def _compressor(encoding):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    # wbits=31 writes a gzip container that any gzip reader can open
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+def compress_text(data):
+    """Compress UTF-8 bytes with the configured codec; returns (body, content_encoding)"""
+    if S3_TEXT_COMPRESSION not in ('zstd', 'gzip'):
+        return data, None
+    compressor = _compressor(S3_TEXT_COMPRESSION)
+    return compressor.compress(data) + compressor.flush(), S3_TEXT_COMPRESSION
+
+def decompress_text(body, content_encoding):
+    """Inverse of compress_text; objects without a Content-Encoding are returned as-is"""
+    if content_encoding == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed documents")
+        # Streamed frames carry no content size, so use a decompression object
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    if content_encoding == 'gzip':
+        return gzip.decompress(body)
+    return body
+
 class S3UploadError(Exception):
     """Custom exception for S3 upload errors"""
     pass
 
+class _BlockStream(io.RawIOBase):
+    """Read-only stream over blocks of bytes produced by `_next_block`.
+
+    Reads are filled across blocks up to the requested size: s3transfer reads
+    the multipart threshold once to choose between a single put and a
+    multipart upload, and then reads whole parts, so a short read would make
+    it buffer the entire body or send parts below S3's minimum size.
+    """
+
+    def __init__(self):
+        self._buffer = b''
+        self._exhausted = False
+
+    def readable(self):
+        return True
+
+    def _next_block(self):
+        """The next block of bytes, or b'' at the end of the stream"""
+        raise NotImplementedError
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        filled = 0
+        while filled < len(view):
+            if not self._buffer:
+                if self._exhausted:
+                    break
+                self._buffer = self._next_block()
+                if not self._buffer:
+                    self._exhausted = True
+                    break
+            size = min(len(view) - filled, len(self._buffer))
+            view[filled:filled + size] = self._buffer[:size]
+            self._buffer = self._buffer[size:]
+            filled += size
+        return filled
+
+class TextChunkStream(_BlockStream):
+    """Read-only byte stream over an iterable of text chunks, encoded as UTF-8 on the fly"""
+
+    def __init__(self, chunks, separator=' '):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._separator = separator
+        self._first = True
+        self.bytes_read = 0
+
+    def _next_block(self):
+        while True:
+            try:
+                chunk = next(self._chunks)
+            except StopIteration:
+                return b''
+            if not self._first:
+                chunk = self._separator + chunk
+            self._first = False
+            data = chunk.encode('utf-8')
+            if data:
+                self.bytes_read += len(data)
+                return data
+
+class CompressingStream(_BlockStream):
+    """Read-only stream that compresses another stream as it is read"""
+
+    def __init__(self, source, encoding, read_size=1024 * 1024):
+        super().__init__()
+        self._source = source
+        self._compressor = _compressor(encoding)
+        self._read_size = read_size
+        self._finished = False
+
+    def _next_block(self):
+        # Compressors may hold back output until they have seen enough input
+        while not self._finished:
+            data = self._source.read(self._read_size)
+            if data:
+                block = self._compressor.compress(data)
+            else:
+                block = self._compressor.flush()
+                self._finished = True
+            if block:
+                return block
+        return b''
+
 class S3Manager:
     def __init__(self):
         self.aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
@@ -33,6 +173,17 @@ class S3Manager:
             aws_access_key_id=self.aws_access_key_id,
             aws_secret_access_key=self.aws_secret_access_key
         )
+        self.document_cache = DocumentCache(
+            max_memory_bytes=DOCUMENT_CACHE_MEMORY_BYTES,
+            disk_dir=DOCUMENT_CACHE_DIR or None,
+            max_disk_bytes=DOCUMENT_CACHE_DISK_BYTES,
+            revalidate_after=DOCUMENT_CACHE_REVALIDATE_SECONDS
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=S3_MAX_CONCURRENCY
+        )
 
     def upload_document(self, project_id, file_name, content):
         """Upload a document to S3 and return its key"""
@@ -50,56 +201,243 @@ class S3Manager:
         try:
             key = f"{project_id}/documents/{file_name}"
             
+            text = content if isinstance(content, str) else None
+
             # Convert string content to bytes if necessary
             if isinstance(content, str):
                 content = content.encode('utf-8')
                 
+            response = self._put_text(key, content)
+            logger.info(f"Successfully uploaded document to S3: {key}")
+
+            # Write through so the first slide generation doesn't download it again
+            if text is not None and response.get('ETag'):
+                self.document_cache.put(key, response['ETag'], text)
+            else:
+                self.document_cache.invalidate(key)
+            return key
+        except ClientError as e:
+            logger.error(f"Failed to upload document to S3: {str(e)}")
+            raise S3UploadError(f"Failed to upload document: {str(e)}")
+
+    def _put_text(self, key, data):
+        """Store UTF-8 text bytes, compressed with a Content-Encoding marker"""
+        body, content_encoding = compress_text(data)
+        extra_args = {'ContentEncoding': content_encoding} if content_encoding else {}
+        return self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=key,
+            Body=body,
+            ContentType='text/plain; charset=utf-8',
+            **extra_args
+        )
+
+    def upload_fileobj(self, key, fileobj, extra_args=None):
+        """Stream a file-like object to S3 with managed multipart transfer"""
+        try:
+            self.s3_client.upload_fileobj(
+                fileobj,
+                self.bucket_name,
+                key,
+                ExtraArgs=extra_args,
+                Config=self.transfer_config
+            )
+            logger.info(f"Successfully streamed object to S3: {key}")
+            return key
+        except ClientError as e:
+            logger.error(f"Failed to stream object to S3: {str(e)}")
+            raise S3UploadError(f"Failed to upload {key}: {str(e)}")
+
+    def upload_original(self, project_id, file_name, fileobj):
+        """Keep the original uploaded file so documents can be re-extracted later"""
+        logger.info(f"Attempting to upload original file: {file_name} for project: {project_id}")
+        return self.upload_fileobj(f"{project_id}/originals/{file_name}", fileobj)
+
+    def upload_document_stream(self, project_id, file_name, chunks):
+        """Upload extracted text from an iterable of chunks without holding it all in memory"""
+        logger.info(f"Attempting to stream document: {file_name} for project: {project_id}")
+        return self.upload_text_stream(f"{project_id}/documents/{file_name}", chunks)
+
+    @staticmethod
+    def blob_keys(content_hash):
+        """Keys of the shared, content-addressed objects for an upload hash"""
+        return {
+            'text': f"blobs/{content_hash}/text",
+            'original': f"blobs/{content_hash}/original"
+        }
+
+    def upload_blob(self, content_hash, chunks, original):
+        """Store extracted text and the original file under content-addressed keys"""
+        logger.info(f"Attempting to upload blob: {content_hash}")
+        keys = self.blob_keys(content_hash)
+        self.upload_text_stream(keys['text'], chunks)
+        self.upload_fileobj(keys['original'], original)
+        return keys
+
+    def delete_blob(self, content_hash):
+        """Delete a content-addressed blob once nothing references it"""
+        logger.info(f"Attempting to delete blob: {content_hash}")
+        keys = self.blob_keys(content_hash)
+        for key in keys.values():
+            self.document_cache.invalidate(key)
+        try:
+            self._delete_keys(list(keys.values()))
+        except (ClientError, S3UploadError) as e:
+            logger.error(f"Failed to delete blob from S3: {str(e)}")
+            raise
+
+    def upload_text_stream(self, key, chunks):
+        """Stream text chunks to `key`, compressed with the configured codec"""
+        stream = TextChunkStream(chunks)
+        extra_args = {'ContentType': 'text/plain; charset=utf-8'}
+        if S3_TEXT_COMPRESSION in ('zstd', 'gzip'):
+            extra_args['ContentEncoding'] = S3_TEXT_COMPRESSION
+            self.upload_fileobj(key, CompressingStream(stream, S3_TEXT_COMPRESSION), extra_args)
+        else:
+            self.upload_fileobj(key, stream, extra_args)
+        self.document_cache.invalidate(key)
+
+        if stream.bytes_read == 0:
+            logger.error("Empty content provided")
+            self.delete_document(key)
+            raise S3UploadError("Cannot upload empty or None content")
+        return key
+
+    def upload_corpus(self, project_id, corpus_hash, text):
+        """Upload a project corpus artifact and return its key"""
+        key = f"{project_id}/corpus/{corpus_hash}.txt"
+        logger.info(f"Attempting to upload corpus for project: {project_id}")
+        try:
+            response = self._put_text(key, text.encode('utf-8'))
+            self.document_cache.put(key, response['ETag'], text)
+            logger.info(f"Successfully uploaded corpus to S3: {key}")
+            return key
+        except ClientError as e:
+            logger.error(f"Failed to upload corpus to S3: {str(e)}")
+            raise S3UploadError(f"Failed to upload corpus: {str(e)}")
+
+    def upload_export(self, project_id, export_hash, pdf_bytes):
+        """Persist a rendered PDF export and return its key"""
+        key = f"{project_id}/exports/{export_hash}.pdf"
+        logger.info(f"Attempting to upload export for project: {project_id}")
+        try:
             self.s3_client.put_object(
                 Bucket=self.bucket_name,
                 Key=key,
-                Body=content
+                Body=pdf_bytes,
+                ContentType='application/pdf'
             )
-            logger.info(f"Successfully uploaded document to S3: {key}")
+            logger.info(f"Successfully uploaded export to S3: {key}")
             return key
         except ClientError as e:
-            logger.error(f"Failed to upload document to S3: {str(e)}")
-            raise S3UploadError(f"Failed to upload document: {str(e)}")
+            logger.error(f"Failed to upload export to S3: {str(e)}")
+            raise S3UploadError(f"Failed to upload export: {str(e)}")
 
-    def get_document(self, key):
-        """Retrieve a document from S3"""
-        logger.info(f"Attempting to retrieve document with key: {key}")
+    def get_export(self, project_id, export_hash):
+        """Return a previously rendered PDF export, or None if there isn't one"""
+        key = f"{project_id}/exports/{export_hash}.pdf"
         try:
             response = self.s3_client.get_object(
                 Bucket=self.bucket_name,
                 Key=key
             )
-            content = response['Body'].read().decode('utf-8')
-            logger.info(f"Successfully retrieved document from S3: {key}")
-            return content
+            logger.info(f"Retrieved export from S3: {key}")
+            return response['Body'].read()
         except ClientError as e:
-            logger.error(f"Failed to retrieve document from S3: {str(e)}")
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            logger.error(f"Failed to retrieve export from S3: {str(e)}")
             raise
 
-    def delete_project_documents(self, project_id):
-        """Delete all documents for a project"""
-        logger.info(f"Attempting to delete all documents for project: {project_id}")
+    def delete_document(self, key):
+        """Delete a single object from S3"""
+        logger.info(f"Attempting to delete object: {key}")
+        self.document_cache.invalidate(key)
         try:
-            # List all objects with the project prefix
-            prefix = f"{project_id}/documents/"
-            objects_to_delete = self.s3_client.list_objects_v2(
+            self.s3_client.delete_object(
                 Bucket=self.bucket_name,
-                Prefix=prefix
+                Key=key
             )
-            
-            if 'Contents' in objects_to_delete:
-                delete_keys = {'Objects': [{'Key': obj['Key']} for obj in objects_to_delete['Contents']]}
-                self.s3_client.delete_objects(
+        except ClientError as e:
+            logger.error(f"Failed to delete object from S3: {str(e)}")
+            raise
+
+    def get_document(self, key):
+        """Retrieve a document, reading through the document cache"""
+        cached = self.document_cache.get(key)
+        if cached is not None:
+            logger.info(f"Document cache hit: {key}")
+            return cached[1]
+
+        logger.info(f"Attempting to retrieve document with key: {key}")
+        try:
+            # An older memory entry or a disk entry may be outdated by another
+            # worker's re-upload, so confirm its ETag with a HEAD request
+            # instead of downloading the body
+            unconfirmed = self.document_cache.get_unconfirmed(key)
+            if unconfirmed is not None:
+                etag, content = unconfirmed
+                head = self.s3_client.head_object(
                     Bucket=self.bucket_name,
-                    Delete=delete_keys
+                    Key=key
                 )
-                logger.info(f"Successfully deleted documents for project: {project_id}")
-            else:
-                logger.info(f"No documents found to delete for project: {project_id}")
+                if head.get('ETag') == etag:
+                    self.document_cache.confirm(key, etag, content)
+                    logger.info(f"Document cache hit after revalidation: {key}")
+                    return content
+
+            response = self.s3_client.get_object(
+                Bucket=self.bucket_name,
+                Key=key
+            )
+            # Objects written before compression was enabled have no Content-Encoding
+            body = decompress_text(response['Body'].read(), response.get('ContentEncoding'))
+            content = body.decode('utf-8')
+            self.document_cache.put(key, response['ETag'], content)
+            logger.info(f"Successfully retrieved document from S3: {key}")
+            return content
         except ClientError as e:
-            logger.error(f"Failed to delete documents from S3: {str(e)}")
-            raise 
\ No newline at end of file
+            logger.error(f"Failed to retrieve document from S3: {str(e)}")
+            raise
+
+    def delete_project_documents(self, project_id, orphaned_blobs=(), on_progress=None):
+        """Delete every object of a project, plus shared blobs it held the last reference to.
+
+        Keys are listed page by page and each page of up to 1000 keys is
+        removed with one DeleteObjects call, with several pages in flight.
+        on_progress(deleted) is called with the running count. Returns the
+        number of deleted objects.
+        """
+        logger.info(f"Attempting to delete all documents for project: {project_id}")
+        self.document_cache.invalidate_project(project_id)
+        for content_hash in orphaned_blobs:
+            self.delete_blob(content_hash)
+
+        deleted = 0
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        with ThreadPoolExecutor(max_workers=S3_DELETE_CONCURRENCY, thread_name_prefix='s3-delete') as executor:
+            batches = []
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=f"{project_id}/",
+                                           PaginationConfig={'PageSize': 1000}):
+                keys = [obj['Key'] for obj in page.get('Contents', [])]
+                if keys:
+                    batches.append(executor.submit(self._delete_keys, keys))
+            for batch in as_completed(batches):
+                deleted += batch.result()
+                if on_progress:
+                    on_progress(deleted)
+
+        logger.info(f"Deleted {deleted} objects for project: {project_id}")
+        return deleted
+
+    def _delete_keys(self, keys):
+        response = self.s3_client.delete_objects(
+            Bucket=self.bucket_name,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+        )
+        errors = response.get('Errors', [])
+        if errors:
+            # Raising lets the caller retry; keys already deleted simply won't be listed again
+            raise S3UploadError(f"Failed to delete {len(errors)} objects, e.g. {errors[0].get('Key')}: "
+                                f"{errors[0].get('Message')}")
+        return len(keys)
@@ -0,0 +1,88 @@
+import threading
+from typing import Dict, List, Tuple
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+# Words measured per (font, size) before the table is reset
+WIDTH_TABLE_MAX_WORDS = 50000
+
+# Space kept free at the bottom of a page when no margin is given
+DEFAULT_BOTTOM_MARGIN = 60
+
+
+class WidthTable:
+    """Memoized word widths for one font and size"""
+
+    def __init__(self, font: str, font_size: float):
+        self.font = font
+        self.font_size = font_size
+        self.space_width = stringWidth(' ', font, font_size)
+        self._widths: Dict[str, float] = {}
+
+    def width(self, word: str) -> float:
+        width = self._widths.get(word)
+        if width is None:
+            if len(self._widths) >= WIDTH_TABLE_MAX_WORDS:
+                self._widths.clear()
+            width = stringWidth(word, self.font, self.font_size)
+            self._widths[word] = width
+        return width
+
+
+_tables: Dict[Tuple[str, float], WidthTable] = {}
+_tables_lock = threading.Lock()
+
+
+def get_width_table(font: str, font_size: float) -> WidthTable:
+    key = (font, font_size)
+    table = _tables.get(key)
+    if table is None:
+        with _tables_lock:
+            table = _tables.setdefault(key, WidthTable(font, font_size))
+    return table
+
+
+def wrap_text(text: str, max_width: float, font: str = "Helvetica", font_size: float = 10) -> List[str]:
+    """Split text into lines no wider than max_width.
+
+    Line widths are kept as a running sum of word and space widths, so each
+    word is measured once instead of re-measuring the whole line. A word
+    wider than max_width gets a line of its own.
+    """
+    table = get_width_table(font, font_size)
+    lines = []
+    line: List[str] = []
+    line_width = 0.0
+
+    for word in text.split():
+        word_width = table.width(word)
+        if line and line_width + table.space_width + word_width > max_width:
+            lines.append(' '.join(line))
+            line, line_width = [], 0.0
+        line_width += word_width + (table.space_width if line else 0.0)
+        line.append(word)
+
+    if line:
+        lines.append(' '.join(line))
+    return lines
+
+
+def draw_text_paragraph(c, text, y_position, x_position, max_width, font="Helvetica", font_size=10,
+                        line_height=14, bottom_margin=DEFAULT_BOTTOM_MARGIN, top_position=None):
+    """
+    Draws a text paragraph within specified width, handling line wrapping.
+    Lines that would fall below bottom_margin continue at top_position on a new page.
+    Returns the updated y_position after drawing the text.
+    """
+    if top_position is None:
+        top_position = c._pagesize[1] - bottom_margin
+
+    c.setFont(font, font_size)
+    for line in wrap_text(text, max_width, font, font_size):
+        if y_position < bottom_margin:
+            c.showPage()
+            # showPage resets the graphics state, including the font
+            c.setFont(font, font_size)
+            y_position = top_position
+        c.drawString(x_position, y_position, line)
+        y_position -= line_height
+    return y_position
@@ -0,0 +1,136 @@
+import os
+import re
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from chat_engine import complete_chat
+from messages import SLIDE_TYPES_ENGLISH, SLIDE_TYPES_NORWEGIAN, LANGUAGE_CONFIGS
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('Translation')
+
+load_dotenv()
+
+# Slide text sent per translation call; a whole deck usually fits in one or two
+TRANSLATION_BATCH_CHARS = int(os.getenv('TRANSLATION_BATCH_CHARS', '12000'))
+TRANSLATION_MAX_WORKERS = int(os.getenv('TRANSLATION_MAX_WORKERS', '4'))
+
+# Bullets, numbered items and markdown headings whose markers must survive translation
+_STRUCTURE_MARKER = re.compile(r'^\s*([-•*]|\d+[.)]|#+)\s')
+
+TRANSLATION_PROMPT = """You translate pitch deck slides from {source} to {target}.
+Keep the structure of every slide exactly: the same lines in the same order, and the same bullet,
+numbering and heading markers at the start of each line. Translate only the text. Keep company,
+product and person names, numbers and currencies as they are. A translated slide must not be longer
+than its character_limit. Reply with a JSON object mapping each slide id to its translated text."""
+
+
+def slide_config(slide: str, language: str) -> Optional[Dict]:
+    slide_types = SLIDE_TYPES_ENGLISH if language == "en" else SLIDE_TYPES_NORWEGIAN
+    return slide_types.get(slide.lower().replace(' ', '_'))
+
+
+def structure(text: str) -> List[str]:
+    """The line markers a translation has to reproduce"""
+    markers = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        match = _STRUCTURE_MARKER.match(line)
+        markers.append(match.group(1) if match else '')
+    return markers
+
+
+def check_translation(source: str, translated: str, character_limit: Optional[int]) -> Optional[str]:
+    """Return why a translation is unusable, or None if it keeps the slide's shape"""
+    if not translated or not translated.strip():
+        return 'empty translation'
+    if structure(translated) != structure(source):
+        return 'bullet structure changed'
+    if character_limit and len(translated) > character_limit and len(translated) > len(source):
+        return f'longer than {character_limit} characters'
+    return None
+
+
+def _batches(slides: Dict[str, str]) -> List[List[str]]:
+    batches, batch, size = [], [], 0
+    for name, text in slides.items():
+        if batch and size + len(text) > TRANSLATION_BATCH_CHARS:
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(name)
+        size += len(text)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _translate_batch(names: List[str], slides: Dict[str, str], source: str, target: str) -> Dict[str, str]:
+    payload = {
+        'slides': [
+            {
+                'id': name,
+                'character_limit': (slide_config(name, target) or {}).get('character_limit'),
+                'text': slides[name]
+            }
+            for name in names
+        ]
+    }
+    chars = sum(len(slides[name]) for name in names)
+    reply = complete_chat(
+        json.dumps(payload, ensure_ascii=False),
+        system=TRANSLATION_PROMPT.format(source=LANGUAGE_CONFIGS[source]['name'],
+                                         target=LANGUAGE_CONFIGS[target]['name']),
+        # English runs at about four characters per token and Norwegian nearer three;
+        # one token per two characters leaves room for the JSON around the slides
+        max_tokens=min(chars // 2 + 200, 16000),
+        json_mode=True
+    )
+    if not reply:
+        # Empty or truncated; the slides are retried on their own
+        raise ValueError('no complete translation returned')
+    translated = json.loads(reply)
+    return {name: translated[name] for name in names if isinstance(translated.get(name), str)}
+
+
+def translate_slides(slides: Dict[str, str], source: str, target: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Translate slide texts in batched calls; returns (translations, errors by slide).
+
+    Slides whose translation loses the bullet structure or overruns the
+    character limit are retried once on their own.
+    """
+    translations: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+
+    def run(batches):
+        with ThreadPoolExecutor(max_workers=max(min(TRANSLATION_MAX_WORKERS, len(batches)), 1)) as executor:
+            futures = {executor.submit(_translate_batch, names, slides, source, target): names for names in batches}
+            for future, names in futures.items():
+                try:
+                    translated = future.result()
+                except Exception as e:
+                    logger.error(f"Error translating slides {names}: {str(e)}")
+                    translated = {}
+                for name in names:
+                    if name not in translated:
+                        errors[name] = 'missing from translation'
+                        continue
+                    problem = check_translation(slides[name], translated[name],
+                                                (slide_config(name, target) or {}).get('character_limit'))
+                    if problem:
+                        errors[name] = problem
+                    else:
+                        translations[name] = translated[name]
+                        errors.pop(name, None)
+
+    run(_batches(slides))
+    if errors:
+        logger.warning(f"Retrying translation of {list(errors)}: {errors}")
+        run([[name] for name in errors])
+    return translations, errors
@@ -1,6 +1,6 @@
 from pinecone import Pinecone
 import os
-from openai import OpenAI
+from openai_client import get_openai_client
 import streamlit as st
 from datetime import datetime
 from threading import Lock
@@ -8,8 +8,13 @@ import functools
 import hashlib
 import json
 from typing import List, Dict, Optional, Any, Callable
-import PyPDF2
-from io import BytesIO
+import tempfile
+from document_extraction import iter_pdf_pages
+from cache import LRUCache
+from rate_limiter import get_rate_governor, estimate_tokens, reported_tokens
+
+# Embeddings of document content keyed by its sha256, shared by all projects
+BLOB_EMBEDDINGS_NAMESPACE = 'blob_embeddings'
 
 def with_storage_lock(func):
     """Decorator to ensure thread-safe storage operations"""
@@ -39,6 +44,7 @@ class VectorStore:
             self._document_cache = {}
             self._slide_cache = {}
             self._html_cache = {}
+            self._embedding_cache = LRUCache(32 * 1024 * 1024, sizeof=lambda vector: len(vector) * 8)
             
             # Initialize Pinecone with additional error handling
             try:
@@ -89,7 +95,7 @@ class VectorStore:
                 
             # Initialize OpenAI client
             try:
-                self.client = OpenAI()
+                self.client = get_openai_client()
                 self.log_function("Initialization", "OpenAI client initialized")
             except Exception as e:
                 self.log_function("Error", f"OpenAI client initialization failed: {str(e)}", error=True)
@@ -118,11 +124,12 @@ class VectorStore:
         try:
             namespace = self.get_project_namespace(project_id, 'docs')
             
-            # Generate a unique document ID
-            doc_id = f"doc_{datetime.now().timestamp()}"
+            # Documents are addressed by content, so re-uploads replace rather than duplicate
+            content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+            doc_id = f"doc_{content_hash}"
             
-            # Create embedding for content
-            vector = self.embed_text(content)
+            # Create embedding for content, reusing one stored for identical content
+            vector = self.embed_content(content_hash, content)
             print("Embedded document")
             if not vector:
                 return False
@@ -162,8 +169,14 @@ class VectorStore:
             if file_obj.type == "text/plain":
                 return file_obj.read().decode('utf-8', errors='ignore')
             elif file_obj.type == "application/pdf":
-                pdf_reader = PyPDF2.PdfReader(BytesIO(file_obj.read()))
-                return "\n".join(page.extract_text() for page in pdf_reader.pages)
+                # Extract page ranges in the shared extraction pool, under its time and memory limits
+                fd, path = tempfile.mkstemp(suffix='.pdf')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(file_obj.read())
+                    return "\n".join(iter_pdf_pages(path))
+                finally:
+                    os.remove(path)
             else:
                 self.log_function("⚠️", f"Unsupported file type: {file_obj.type}")
                 return None
@@ -196,10 +209,12 @@ class VectorStore:
     def embed_text(self, text: str) -> Optional[List[float]]:
         """Create embedding for text using OpenAI ada-002"""
         try:
-            response = self.client.embeddings.create(
-                input=text,
-                model="text-embedding-ada-002"  # Using ada-002 for 1536 dimensions
-            )
+            with get_rate_governor('embeddings').admit(estimate_tokens(text)) as grant:
+                response = self.client.embeddings.create(
+                    input=text,
+                    model="text-embedding-ada-002"  # Using ada-002 for 1536 dimensions
+                )
+                grant.usage = reported_tokens(response)
             
             embedding = response.data[0].embedding
             return embedding
@@ -208,6 +223,53 @@ class VectorStore:
             self.log_function("🔴", f"Embedding failed: {str(e)}")
             return None
 
+    def embed_content(self, content_hash: str, content: str) -> Optional[List[float]]:
+        """Embed content once per content hash, sharing the vector across projects"""
+        vector = self._embedding_cache.get(content_hash)
+        if vector:
+            return vector
+        try:
+            stored = self.index.fetch(ids=[content_hash], namespace=BLOB_EMBEDDINGS_NAMESPACE)
+            if content_hash in stored.vectors:
+                vector = list(stored.vectors[content_hash].values)
+        except Exception as e:
+            self.log_function("⚠️", f"Embedding lookup failed: {str(e)}")
+
+        if not vector:
+            vector = self.embed_text(content)
+            if not vector:
+                return None
+            try:
+                self.index.upsert(
+                    vectors=[(content_hash, vector, {'content_hash': content_hash})],
+                    namespace=BLOB_EMBEDDINGS_NAMESPACE
+                )
+            except Exception as e:
+                self.log_function("⚠️", f"Failed to share embedding: {str(e)}")
+
+        self._embedding_cache.put(content_hash, vector)
+        return vector
+
+    def embed_texts(self, texts: List[str], batch_size: int = 256) -> Optional[List[List[float]]]:
+        """Create embeddings for many texts, batching them into few API calls"""
+        try:
+            embeddings = []
+            for start in range(0, len(texts), batch_size):
+                batch = texts[start:start + batch_size]
+                with get_rate_governor('embeddings').admit(estimate_tokens(*batch)) as grant:
+                    response = self.client.embeddings.create(
+                        input=batch,
+                        model="text-embedding-ada-002"
+                    )
+                    grant.usage = reported_tokens(response)
+                # The API may return items out of order; sort by their index
+                embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+            return embeddings
+
+        except Exception as e:
+            self.log_function("🔴", f"Batch embedding failed: {str(e)}")
+            return None
+
     @with_storage_lock
     def store_slide(self, project_id: str, slide_type: str, content: Dict, 
                    language: str = "no") -> bool:
@@ -372,13 +434,17 @@ class VectorStore:
         """Clear all project data with improved error handling"""
         try:
             # Clear data from each namespace
+            # Every namespace belongs to the project, so drop them whole;
+            # metadata-filtered deletes aren't supported on all index types
             namespaces = ['docs', 'slides', 'html']
             for ns_type in namespaces:
                 namespace = self.get_project_namespace(project_id, ns_type)
-                self.index.delete(
-                    namespace=namespace,
-                    filter={"project_id": project_id}
-                )
+                try:
+                    self.index.delete(delete_all=True, namespace=namespace)
+                except Exception as e:
+                    # Namespaces that were never written don't exist
+                    if 'not found' not in str(e).lower():
+                        raise
             
             # Clear caches
             self._document_cache.pop(project_id, None)